@@ -0,0 +1,110 @@
+import asyncio, logging, time
+
+# optional dependency, only needed for --asyncio: pip install qasync
+try:
+    import qasync
+except ImportError:
+    qasync = None
+
+# asyncio acquisition mode: CAN reception, logging and display refresh all
+# run as coroutines on one event loop that is also the Qt event loop
+# (through qasync). python-can's Notifier registers the socket with the loop
+# instead of starting a receive thread, so nothing contends with the UI for
+# the GIL. GPS comes from gpsreader's thread, which never blocks the loop.
+#
+# Periodic work goes through PriorityScheduler: when several jobs are due at
+# once they run in priority order (lower number first), so a slow log write
+# can delay, but never starve, the display refresh.
+
+PRIORITY_DISPLAY = 0
+PRIORITY_LOG = 1
+
+
+def create_event_loop(app):
+    if qasync is None:
+        raise RuntimeError('asyncio mode needs the optional qasync package (pip install qasync)')
+    loop = qasync.QEventLoop(app)
+    asyncio.set_event_loop(loop)
+    return loop
+
+
+class PeriodicJob():
+
+    def __init__(self, callback, period, priority):
+        self.callback = callback
+        self.period = period
+        self.priority = priority
+        self.deadline = 0.
+        self.overruns = 0
+
+
+class PriorityScheduler():
+
+    def __init__(self):
+        self.jobs = []
+
+    def add(self, callback, period, priority):
+        # callback is a plain function or a coroutine function
+        job = PeriodicJob(callback, period, priority)
+        self.jobs.append(job)
+        return job
+
+    async def run(self):
+        now = time.perf_counter()
+        for job in self.jobs:
+            job.deadline = now
+
+        while True:
+            deadline = min(job.deadline for job in self.jobs)
+            delay = deadline - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            now = time.perf_counter()
+            due = sorted((job for job in self.jobs if job.deadline <= now), key=lambda job: job.priority)
+            for job in due:
+                try:
+                    result = job.callback()
+                    if asyncio.iscoroutine(result):
+                        await result
+                except Exception as e:
+                    logging.exception(f'Scheduled job failed: {e}')
+
+                # keep the phase, skipping ticks that were missed entirely
+                job.deadline += job.period
+                now = time.perf_counter()
+                if job.deadline <= now:
+                    missed = int((now - job.deadline) // job.period) + 1
+                    job.deadline += missed * job.period
+                    job.overruns += missed
+
+            # let CAN reception and Qt events in between rounds
+            await asyncio.sleep(0)
+
+
+async def start(can_manager, display_manager, logger):
+    scheduler = PriorityScheduler()
+    receive = asyncio.ensure_future(can_manager.receive())
+
+    # give the bus a moment before the first refresh
+    await asyncio.sleep(1)
+
+    scheduler.add(display_manager.update_displays, 0.016, PRIORITY_DISPLAY)
+    if logger:
+        scheduler.add(logger.write_log, 0.010, PRIORITY_LOG)
+
+    try:
+        await scheduler.run()
+    finally:
+        receive.cancel()
+
+
+def run(loop, app, can_manager, display_manager, logger=None):
+    task = loop.create_task(start(can_manager, display_manager, logger))
+    app.aboutToQuit.connect(task.cancel)
+    with loop:
+        try:
+            loop.run_until_complete(task)
+        except asyncio.CancelledError:
+            pass
+    return 0
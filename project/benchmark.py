@@ -0,0 +1,679 @@
+import argparse, timeit, time, os, re, tempfile, threading, struct
+import numpy as np
+
+import candecoder, signalspec, candump, paralleldecode, signalstore, canmanager, socketcanrx, binlog, framelog, segmentlog, gpsfusion, laptiming, gear, canfilter
+
+
+def write_candump(filename, frames, ids=(0x200, 0x201, 0x231, 0x240, 0x420)):
+    rng = np.random.default_rng(0)
+    canids = rng.choice(ids, frames)
+    payloads = rng.integers(0, 256, (frames, 8), dtype=np.uint8)
+    t0 = 1680000000.
+    with open(filename, 'w') as file:
+        for i in range(frames):
+            file.write(f'({t0 + i * 1e-4:.6f}) can0 {canids[i]:03X}#{payloads[i].tobytes().hex().upper()}\n')
+
+
+def bench_decode(args):
+    rng = np.random.default_rng(0)
+    payloads = rng.integers(0, 256, (args.frames, 8), dtype=np.uint8)
+    timestamps = np.arange(args.frames, dtype=np.float64)
+    frames = [bytearray(p) for p in payloads]
+
+    print(f'{"decoder":<16}{"hand-written":>16}{"signal spec":>16}{"batch":>16}   (ns/frame)')
+    for name in ['Can200Decoder', 'Can201Decoder', 'Can231Decoder', 'Can240Decoder']:
+        hand = getattr(candecoder, name)
+        spec = getattr(signalspec, name)
+
+        def run_hand():
+            for f in frames:
+                hand.decode(f)
+
+        def run_spec():
+            for f in frames:
+                spec.decode(f)
+
+        def run_batch():
+            spec.decode_batch(payloads, timestamps)
+
+        times = [min(timeit.repeat(fn, number=1, repeat=args.repeat)) / args.frames * 1e9
+            for fn in (run_hand, run_spec, run_batch)]
+        print(f'{name:<16}' + ''.join(f'{t:>16.1f}' for t in times))
+
+
+def bench_parse(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = args.file or os.path.join(tmp, 'candump.log')
+        if not args.file:
+            write_candump(filename, args.frames)
+        size = os.path.getsize(filename) / 1e6
+
+        # the original offline_analysis loop
+        pat = re.compile(r"\(([0-9\.]+)\) [\w]+ ([0-9A-Fa-f]+)#([\w]+)")
+        start = time.perf_counter()
+        results = []
+        with open(filename) as file:
+            for l in file:
+                res = pat.match(l)
+                if res:
+                    t, id, data = res.group(1, 2, 3)
+                    results.append((float(t), int(id, 16), bytes.fromhex(data)))
+        regex = time.perf_counter() - start
+
+        start = time.perf_counter()
+        frames = candump.read_candump(filename)
+        bulk = time.perf_counter() - start
+
+        print(f'{size:.1f} MB, {len(frames.timestamp)} frames')
+        print(f'regex loop {regex:8.3f} s {size / regex:8.1f} MB/s')
+        print(f'bulk       {bulk:8.3f} s {size / bulk:8.1f} MB/s')
+
+
+def bench_parallel(args):
+    decoders = signalspec.decoders
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = args.file or os.path.join(tmp, 'candump.log')
+        if not args.file:
+            write_candump(filename, args.frames)
+
+        start = time.perf_counter()
+        paralleldecode.decode_parallel(filename, decoders, processes=1)
+        serial = time.perf_counter() - start
+        print(f'{1:>3} process   {serial:8.3f} s')
+
+        jobs = 2
+        while jobs <= args.jobs:
+            start = time.perf_counter()
+            paralleldecode.decode_parallel(filename, decoders, processes=jobs)
+            elapsed = time.perf_counter() - start
+            print(f'{jobs:>3} processes {elapsed:8.3f} s  speedup {serial / elapsed:5.2f}x')
+            jobs *= 2
+
+
+def bench_store(args):
+    decoder = signalspec.Can201Decoder
+    fields = decoder.result._fields[:-1]
+    # every field of frame k holds k, so a torn read shows up as mixed values
+    results = [decoder.result(*([k] * len(fields)), b'') for k in range(1024)]
+
+    store = signalstore.SignalStore([decoder])
+    plain = {}
+
+    def write_store(data, timestamp):
+        store.write(data, timestamp)
+
+    def read_store():
+        return store.read(canfilter.frame_id(decoder))[2][:-1]
+
+    def write_dict(data, timestamp):
+        # the previous DisplayManager.get_can_update
+        for k, v in data._asdict().items():
+            plain[k] = v
+
+    def read_dict():
+        return [plain.get(f, 0) for f in fields]
+
+    for name, write, read in [('dict', write_dict, read_dict), ('store', write_store, read_store)]:
+        stop = threading.Event()
+        written = [0]
+
+        def writer():
+            period = 1 / args.rate
+            next_t = time.perf_counter()
+            k = 0
+            while not stop.is_set():
+                write(results[k % len(results)], time.time())
+                k += 1
+                next_t += period
+                delay = next_t - time.perf_counter()
+                if delay > 0.001:
+                    time.sleep(delay)
+            written[0] = k
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+
+        reads = torn = 0
+        worst = 0.
+        start = time.perf_counter()
+        while time.perf_counter() - start < args.seconds:
+            t = time.perf_counter()
+            values = read()
+            worst = max(worst, time.perf_counter() - t)
+            reads += 1
+            if len(set(values)) > 1:
+                torn += 1
+            time.sleep(1 / args.read_hz)
+
+        stop.set()
+        thread.join()
+        elapsed = time.perf_counter() - start
+        print(f'{name:<6} {written[0] / elapsed:9.0f} frames/s  {reads} reads  {torn} torn  '
+            f'worst read {worst * 1e6:.1f} us' + (f'  {store.retries} retries' if name == 'store' else ''))
+
+
+def bench_lazy(args):
+    # CPU cost per second of saturated bus: eager decode of every frame
+    # against keeping the latest payload and decoding at display rate
+    decoders = signalspec.decoders
+    display = ['rpm', 'speed', 'accpos', 'brake', 'clutch', 'gearneutral', 'ect', 'iat']
+    rng = np.random.default_rng(0)
+    n = int(args.rate * args.seconds)
+    ids = rng.choice([canfilter.frame_id(d) for d in decoders], n)
+    payloads = [bytearray(p) for p in rng.integers(0, 256, (n, 8), dtype=np.uint8)]
+    by_id = {canfilter.frame_id(d): d for d in decoders}
+    frames_per_read = int(args.rate / args.read_hz)
+
+    for name in ['eager', 'lazy']:
+        store = signalstore.SignalStore(decoders)
+        groups = store.groups_for(display)
+        start = time.process_time()
+        for i in range(n):
+            canid = ids[i]
+            if name == 'eager':
+                store.write(by_id[canid].decode(payloads[i]), i)
+            else:
+                store.write_raw(canid, payloads[i], i)
+            if i % frames_per_read == 0:
+                store.snapshot(groups)
+        cpu = time.process_time() - start
+        print(f'{name:<6} {cpu / args.seconds * 100:6.1f} % CPU  {store.decoded if name == "lazy" else n} decodes')
+
+
+def bench_rx(args):
+    # needs a vcan interface:
+    #   ip link add dev vcan0 type vcan && ip link set up vcan0
+    ids = [canfilter.frame_id(d) for d in signalspec.decoders] + [0x7e8, 0x100]
+    rng = np.random.default_rng(0)
+    packets = [struct.pack('=IB3x8s', int(canid), 8, bytes(rng.integers(0, 256, 8, dtype=np.uint8)))
+        for canid in rng.choice(ids, 4096)]
+
+    for backend in ['notifier', 'bulk']:
+        received = [0]
+        last = [0.]
+
+        def count_frame(data, timestamp, bus):
+            received[0] += 1
+            last[0] = time.perf_counter()
+
+        def count_batch(frames, bus):
+            received[0] += len(frames.id)
+            last[0] = time.perf_counter()
+
+        mgr = canmanager.CanBusManager(args.channel, decoders=signalspec.decoders, backend=backend,
+            posthook=count_frame if backend == 'notifier' else None, batch_posthook=count_batch)
+
+        sender = socketcanrx.open_can_socket(args.channel, filters=[])
+        sent = 0
+        start = time.perf_counter()
+        for i in range(args.frames):
+            try:
+                sender.send(packets[i % len(packets)])
+                sent += 1
+            except OSError:
+                # transmit queue full
+                time.sleep(0.0001)
+
+        while time.perf_counter() - max(last[0], start) < 0.5:
+            time.sleep(0.1)
+        mgr.stop()
+        sender.close()
+
+        elapsed = last[0] - start
+        # frames of IDs without a decoder are rejected by the kernel filters
+        wanted = sum(1 for i in range(sent) if struct.unpack_from('=I', packets[i % len(packets)])[0] in mgr.decoders)
+        print(f'{backend:<9} {received[0] / elapsed:9.0f} frames/s  {received[0]} of {wanted} wanted frames received')
+
+
+def bench_filters(args):
+    # needs a vcan interface, see rx. A receiver on a busy bus where most
+    # traffic is unwanted: without kernel filters (everything delivered and
+    # rejected in user space), with one filter per ID, and with the minimal
+    # filter set. On vcan the filters run inside the sender's send(), so
+    # their cost shows as send time.
+    standard = list(range(0x200, 0x200 + args.ids))
+    extended = list(range(0x18fef100, 0x18fef100 + args.extended))
+    decoders = ([signalspec.compile_decoder(i, []) for i in standard]
+        + [signalspec.compile_decoder(i, [], extended=True) for i in extended])
+    wanted = np.array([canfilter.frame_id(d) for d in decoders], dtype=np.uint32)
+
+    rng = np.random.default_rng(0)
+    unwanted_ids = np.setdiff1d(np.arange(0x800), standard)
+    ids = np.where(rng.random(4096) < args.unwanted, rng.choice(unwanted_ids, 4096), rng.choice(wanted, 4096))
+    packets = [struct.pack('=IB3x8s', int(canid), 8, bytes(8)) for canid in ids]
+    wanted_sent = np.isin(ids, wanted)
+
+    modes = [('none', None), ('per id', [canmanager.CanBusManager.filter_from_decoder(d) for d in decoders]),
+        ('minimal', canfilter.filters_for(decoders))]
+    for name, filters in modes:
+        receiver = socketcanrx.BulkSocketcanReceiver(sock=socketcanrx.open_can_socket(args.channel, filters))
+        received = [0, 0, 0.]
+        running = [True]
+
+        def receive():
+            start = time.thread_time()
+            while running[0]:
+                frames = receiver.recv_batch()
+                if frames is None:
+                    continue
+                received[0] += len(frames.id)
+                # the user space rejection the kernel filters replace
+                received[1] += np.count_nonzero(np.isin(frames.id, wanted))
+            received[2] = time.thread_time() - start
+
+        thread = threading.Thread(target=receive)
+        thread.start()
+        sender = socketcanrx.open_can_socket(args.channel, filters=[])
+        sent = 0
+        start = time.perf_counter()
+        while sent < args.frames:
+            try:
+                sender.send(packets[sent % len(packets)])
+                sent += 1
+            except OSError:
+                # transmit queue full
+                time.sleep(0.0001)
+        send_time = time.perf_counter() - start
+        time.sleep(0.5)
+        running[0] = False
+        thread.join()
+        sender.close()
+        receiver.sock.close()
+
+        wanted_count = int(np.count_nonzero(wanted_sent[np.arange(sent) % len(packets)]))
+        print(f'{name:<8} {0 if filters is None else len(filters):4d} filters  send {send_time / sent * 1e6:6.2f} us/frame  '
+            f'{received[0]:8d} delivered, {received[1]} of {wanted_count} wanted  '
+            f'receiver CPU {received[2] / max(received[1], 1) * 1e6:6.2f} us/wanted frame')
+
+
+def bench_multibus(args):
+    # needs two vcan interfaces:
+    #   for i in 0 1; do ip link add dev vcan$i type vcan && ip link set up vcan$i; done
+    # every channel gets its own sender thread sending only the IDs decoded there
+    bus_decoders = canmanager.assign_decoders(args.channel, signalspec.decoders)
+    rng = np.random.default_rng(0)
+    packets = {channel: [struct.pack('=IB3x8s', int(canid), 8, bytes(rng.integers(0, 256, 8, dtype=np.uint8)))
+        for canid in rng.choice([canfilter.frame_id(d) for d in decoders], 4096)] for channel, decoders in bus_decoders.items() if decoders}
+
+    for backend in ['notifier', 'bulk']:
+        stored = dict.fromkeys(bus_decoders, 0)
+        last = [0.]
+        store = signalstore.SignalStore(signalspec.decoders)
+
+        def store_frame(data, timestamp, bus):
+            store.write(data, timestamp, bus)
+            stored[bus] += 1
+            last[0] = time.perf_counter()
+
+        mgr = canmanager.CanBusManager(list(bus_decoders), decoders=bus_decoders, backend=backend,
+            posthook=store_frame)
+
+        def send(channel, packets):
+            sender = socketcanrx.open_can_socket(channel, filters=[])
+            sent = 0
+            while sent < args.frames:
+                try:
+                    sender.send(packets[sent % len(packets)])
+                    sent += 1
+                except OSError:
+                    # transmit queue full
+                    time.sleep(0.0001)
+            sender.close()
+
+        senders = [threading.Thread(target=send, args=item) for item in packets.items()]
+        start = time.perf_counter()
+        mgr.throughput()
+        for thread in senders:
+            thread.start()
+        for thread in senders:
+            thread.join()
+        while time.perf_counter() - max(last[0], start) < 0.5:
+            time.sleep(0.1)
+        rates = mgr.throughput()
+        mgr.stop()
+
+        # the bulk backend only stores the latest frame per ID of a batch
+        for bus in mgr.buses:
+            print(f'{backend:<9} {bus.channel:<8} {bus.frames_received:8d} of {args.frames} received, '
+                f'{rates[bus.channel]:8.0f} frames/s, {stored[bus.channel]:8d} store updates')
+        print(f'{"":<9} store tags: ' + ', '.join(f'{canfilter.frame_id(d):03X} {bus}' for d, bus in zip(store.decoders, store.buses)
+            if bus is not None))
+
+
+def bench_tach(args):
+    # run with QT_QPA_PLATFORM=offscreen on a headless machine
+    from PyQt5 import QtWidgets
+    import tachwidget
+
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    maximum = 7500
+    bar_style = '''
+            QProgressBar {
+                background-color: #555;
+            }
+            QProgressBar::chunk {background: %s;}
+            '''
+    styles = {'blue': bar_style % 'rgb(53, 132, 228)', 'yellow': bar_style % 'rgb(246, 211, 45)',
+        'red': bar_style % 'rgb(255, 27, 36)'}
+
+    frames = int(args.seconds * 60)
+    for name in ['progressbar', 'tachometer']:
+        if name == 'progressbar':
+            widget = QtWidgets.QProgressBar()
+            widget.setMaximum(maximum)
+            widget.setTextVisible(False)
+        else:
+            widget = tachwidget.TachometerWidget(maximum=maximum)
+        widget.resize(args.width, 80)
+        widget.show()
+        app.processEvents()
+
+        start = time.process_time()
+        for i in range(frames):
+            # full sweep up and down every two seconds, flashing above 6800
+            phase = (i % 120) / 60
+            rpm = round(maximum * (phase if phase < 1 else 2 - phase))
+            if rpm > 6800 and (i // 6) % 2:
+                band = 'red'
+            elif rpm > 5000:
+                band = 'yellow'
+            else:
+                band = 'blue'
+
+            if name == 'progressbar':
+                # what update_displays used to do every tick
+                widget.setProperty('value', rpm)
+                widget.setStyleSheet(styles[band])
+            else:
+                widget.setValue(rpm)
+                widget.setBand(band)
+            app.processEvents()
+        cpu = time.process_time() - start
+        widget.close()
+        print(f'{name:<12} {cpu / frames * 1e3:7.3f} ms CPU per frame  {cpu / args.seconds * 100:5.1f} % at 60 fps')
+
+
+def bench_binlog(args):
+    labels = ['rpm', 'speed', 'accpos', 'brake', 'clutch', 'ect', 'iat', 'gear', 'gps_updated', 'gpstime', 'lat', 'long']
+    # column types as DataLogger gets them from the loggables
+    types = dict.fromkeys(['rpm', 'speed', 'accpos', 'ect', 'iat', 'gear'], '<f4')
+    types.update(dict.fromkeys(['brake', 'clutch', 'gps_updated'], '|u1'))
+    rng = np.random.default_rng(0)
+    values = rng.random((args.rows, len(labels))) * 1000
+    for i, label in enumerate(labels):
+        if types.get(label) == '|u1':
+            values[:, i] = values[:, i] > 500
+    t0 = 1680000000.
+    # strings as DisplayManager and GPSManager hand them to DataLogger
+    rows = [(t0 + i * 0.01, [str(v) for v in row]) for i, row in enumerate(values.tolist())]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_name = os.path.join(tmp, 'log.csv')
+        bin_name = os.path.join(tmp, 'log.bin')
+
+        start = time.perf_counter()
+        with open(csv_name, 'w') as file:
+            file.write('time,' + ','.join(labels) + '\n')
+            file.write(''.join(str(t) + ',' + ','.join(data) + '\n' for t, data in rows))
+        csv_write = time.perf_counter() - start
+
+        start = time.perf_counter()
+        dtype = binlog.make_dtype(labels, types)
+        with open(bin_name, 'wb') as file:
+            file.write(binlog.header(dtype))
+            file.write(binlog.encode_rows(rows, dtype))
+        bin_write = time.perf_counter() - start
+
+        start = time.perf_counter()
+        table = np.loadtxt(csv_name, delimiter=',', skiprows=1)
+        csv_rpm = table[:, 1].sum()
+        csv_read = time.perf_counter() - start
+
+        start = time.perf_counter()
+        log = binlog.read_log(bin_name)
+        bin_rpm = log['rpm'].sum()
+        bin_read = time.perf_counter() - start
+        assert np.isclose(csv_rpm, bin_rpm)
+
+        for name, filename, write, read in [('csv', csv_name, csv_write, csv_read),
+                ('binary', bin_name, bin_write, bin_read)]:
+            print(f'{name:<8} {os.path.getsize(filename) / 1e6:8.1f} MB  write {write:7.3f} s  load {read:7.3f} s')
+
+
+def bench_record(args):
+    rng = np.random.default_rng(0)
+    canids = rng.choice([0x200, 0x201, 0x231, 0x240, 0x420], args.frames).tolist()
+    # slowly changing signals, like a real bus
+    payloads = [bytearray(p) for p in np.cumsum(rng.integers(0, 2, (args.frames, 8)), axis=0).astype(np.uint8)]
+    timestamps = (1680000000. + np.arange(args.frames) / args.rate).tolist()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, 'frames.rec')
+        recorder = framelog.FrameRecorder(filename)
+
+        # the listener side, paced like a saturated bus
+        start = time.perf_counter()
+        hot = 0.
+        for i in range(0, args.frames, 100):
+            t = time.perf_counter()
+            for j in range(i, min(i + 100, args.frames)):
+                recorder.record(canids[j], payloads[j], timestamps[j])
+            hot += time.perf_counter() - t
+            delay = start + (i + 100) / args.rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        backlog = len(recorder._queue)
+        recorder.close()
+        elapsed = time.perf_counter() - start
+
+        frames = framelog.read_frames(filename)
+        assert len(frames.timestamp) == args.frames
+        assert frames.data[-1].tobytes() == bytes(payloads[-1])
+        size = os.path.getsize(filename)
+
+    text = sum(len(f'({t:.6f}) can0 {c:03X}#{p.hex().upper()}\n') for t, c, p in
+        zip(timestamps[:10000], canids[:10000], payloads[:10000])) / min(args.frames, 10000)
+    print(f'{args.frames} frames at {args.rate:.0f}/s in {elapsed:.1f} s, queue at end {backlog}')
+    print(f'record() {hot / args.frames * 1e9:.0f} ns/frame on the CAN thread')
+    print(f'{size / args.frames:.1f} bytes/frame on disk, candump text {text:.1f}')
+
+
+def bench_seek(args):
+    rng = np.random.default_rng(0)
+    t0 = 1680000000.
+    block = int(args.rate * 60)
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = os.path.join(tmp, 'session')
+        recorder = segmentlog.SegmentedFrameRecorder(directory, args.segment_seconds, chunk_frames=8192)
+        for start in range(0, int(args.hours * 3600 * args.rate), block):
+            timestamp = t0 + (start + np.arange(block)) / args.rate
+            canid = rng.choice([0x200, 0x201, 0x231, 0x240, 0x420], block).astype(np.uint32)
+            data = rng.integers(0, 256, (block, 8), dtype=np.uint8)
+            recorder.record_batch(candump.Frames(timestamp, canid, np.full(block, 8, dtype=np.uint8), data))
+            while len(recorder._queue) > 2:
+                time.sleep(0.01)
+        recorder.close()
+        size = sum(os.path.getsize(os.path.join(directory, f)) for f in os.listdir(directory))
+
+        # a lap in the middle of the session
+        lap_start = t0 + args.hours * 3600 / 2
+        start = time.perf_counter()
+        session = segmentlog.Session(directory)
+        frames = session.frames(lap_start, lap_start + args.lap, ids=[0x201])
+        seek = time.perf_counter() - start
+
+        start = time.perf_counter()
+        scanned = 0
+        for s in session.segments:
+            for chunk in framelog.iter_chunks(session.index.path(s['file'])):
+                scanned += np.count_nonzero((chunk.timestamp >= lap_start) & (chunk.timestamp < lap_start + args.lap)
+                    & (chunk.id == 0x201))
+        scan = time.perf_counter() - start
+        assert scanned == len(frames.timestamp)
+
+    print(f'{args.hours:g} h session, {len(session.segments)} segments, {size / 1e6:.0f} MB')
+    print(f'{args.lap:g} s window of 0x201, {len(frames.timestamp)} frames: seek {seek * 1e3:.1f} ms, full scan {scan * 1e3:.0f} ms')
+
+
+def bench_laptiming(args):
+    # laps of a circle, positions at 100 Hz, gates spread evenly around it
+    frame = gpsfusion.LocalFrame(37.9, -122.3)
+    radius = args.length / (2 * np.pi)
+    t = np.arange(0, args.laps * args.lap_seconds, 0.01)
+    a = 2 * np.pi * t / args.lap_seconds
+    lat, lon = frame.to_latlon(radius * np.cos(a), radius * np.sin(a))
+
+    def gate(a):
+        return tuple(frame.to_latlon(r * np.cos(a), r * np.sin(a)) for r in (radius - 15, radius + 15))
+
+    segments = [gate(a) for a in np.linspace(0, 2 * np.pi, 4)[:-1] + 0.01]
+    microsegments = [gate(a) for a in np.linspace(0, 2 * np.pi, args.gates + 1)[:-1] + 0.005]
+
+    for name in ['grid', 'all gates']:
+        timer = laptiming.LapTimer(segments, microsegments)
+        if name == 'all gates':
+            timer.grid.max_cells = 0
+        start = time.perf_counter()
+        laptiming.replay(timer, t, lat, lon)
+        elapsed = time.perf_counter() - start
+        print(f'{name:<10} {elapsed / len(t) * 1e6:8.1f} us/update  laps {[round(l, 2) for l, _ in timer.laps]}')
+
+
+def bench_gear(args):
+    # a run up and down the gears: 0x201 (rpm, speed) at 100 Hz, 0x231
+    # (clutch, neutral) at 50 Hz, half a second of clutch per shift
+    ratios = gear.ref_gear_ratios
+    rng = np.random.default_rng(0)
+    t201 = np.arange(0, args.seconds, 0.01)
+    t231 = np.arange(0.005, args.seconds, 0.02)
+    shift = np.floor(t231 / args.shift_seconds)
+    in_gear = np.abs(np.arange(len(ratios) * 2 - 2)[shift.astype(int) % (len(ratios) * 2 - 2)] - (len(ratios) - 1))
+    clutch = (t231 % args.shift_seconds) < 0.5
+    speed = 20 + 100 * (t201 % args.shift_seconds) / args.shift_seconds
+    g201 = len(ratios) - 1 - in_gear[np.minimum(np.searchsorted(t231, t201), len(t231) - 1)]
+    rpm = speed * np.array(ratios)[g201] * rng.normal(1, 0.02, len(t201))
+    traces = {'rpm': (t201, rpm), 'speed': (t201, speed), 'clutch': (t231, clutch),
+        'gearneutral': (t231, np.zeros(len(t231), dtype=bool))}
+    t, *values = gear.merge_inputs(traces)
+    rows = list(zip(*(v.tolist() for v in [t] + values)))
+
+    def scan(t, rpm, speed, clutch, gearneutral):
+        # the previous per-call version: a division per ratio and the wall clock
+        if speed < 1:
+            return None
+        for i, r in enumerate(ratios):
+            if 0.90 < ((rpm / speed) / r) < 1.10:
+                return i + 1
+        time.time()
+        return None
+
+    detector = gear.GearDetector(ratios)
+    for name, f in [('scan', scan), ('bisect', lambda t, rpm, speed, clutch, gearneutral: detector.lookup(rpm, speed)),
+            ('update', detector.update)]:
+        elapsed = min(timeit.repeat(lambda: [f(*row) for row in rows], number=1, repeat=3))
+        print(f'{name:<10} {elapsed / len(rows) * 1e6:6.2f} us/frame')
+
+    detector = gear.GearDetector(ratios)
+    live = np.array([g if g != gear.neutral else 0 for g in (detector.update(*row) for row in rows)])
+    start = time.perf_counter()
+    _, offline = gear.GearDetector(ratios).detect_traces(traces)
+    elapsed = time.perf_counter() - start
+    print(f'vectorized {elapsed / len(rows) * 1e6:6.2f} us/frame, {np.count_nonzero(live != offline)} differences'
+        f' from live over {len(rows)} evaluations')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+                    prog = 'benchmark',
+                    description = 'Dashboard micro benchmarks')
+    sub = parser.add_subparsers(dest='bench', required=True)
+
+    p = sub.add_parser('decode', help='per frame decode cost')
+    p.add_argument('-n', '--frames', type=int, default=100000)
+    p.add_argument('-r', '--repeat', type=int, default=5)
+    p.set_defaults(func=bench_decode)
+
+    p = sub.add_parser('parse', help='candump log parsing throughput')
+    p.add_argument('-n', '--frames', type=int, default=1000000)
+    p.add_argument('-f', '--file', help='existing candump log instead of a generated one')
+    p.set_defaults(func=bench_parse)
+
+    p = sub.add_parser('parallel', help='multi process log decoding speedup')
+    p.add_argument('-n', '--frames', type=int, default=2000000)
+    p.add_argument('-j', '--jobs', type=int, default=os.cpu_count())
+    p.add_argument('-f', '--file', help='existing candump log instead of a generated one')
+    p.set_defaults(func=bench_parallel)
+
+    p = sub.add_parser('store', help='signal store under a saturated bus with 60 Hz readers')
+    # a standard 8 byte frame is about 111 bits before bit stuffing
+    p.add_argument('--rate', type=float, default=9000, help='frames per second written')
+    p.add_argument('--read-hz', type=float, default=60)
+    p.add_argument('-t', '--seconds', type=float, default=5)
+    p.set_defaults(func=bench_store)
+
+    p = sub.add_parser('lazy', help='CPU use of eager against lazy decoding')
+    p.add_argument('--rate', type=float, default=9000, help='frames per second on the bus')
+    p.add_argument('--read-hz', type=float, default=60)
+    p.add_argument('-t', '--seconds', type=float, default=10, help='seconds of bus traffic')
+    p.set_defaults(func=bench_lazy)
+
+    p = sub.add_parser('rx', help='receive throughput, python-can Notifier against bulk socketcan')
+    p.add_argument('-c', '--channel', default='vcan0')
+    p.add_argument('-n', '--frames', type=int, default=200000)
+    p.set_defaults(func=bench_rx)
+
+    p = sub.add_parser('filters', help='kernel side rejection, minimal filter set against one filter per ID')
+    p.add_argument('-c', '--channel', default='vcan0')
+    p.add_argument('-n', '--frames', type=int, default=200000)
+    p.add_argument('--ids', type=int, default=48, help='wanted standard IDs')
+    p.add_argument('--extended', type=int, default=16, help='wanted extended IDs')
+    p.add_argument('--unwanted', type=float, default=0.9, help='share of unwanted traffic')
+    p.set_defaults(func=bench_filters)
+
+    p = sub.add_parser('multibus', help='per bus throughput of one manager receiving several vcan buses')
+    p.add_argument('-c', '--channel', action='append',
+        help='channel or CHANNEL=ID,ID,... as for mainqt -i, default vcan0=0x201,0x231 and vcan1')
+    p.add_argument('-n', '--frames', type=int, default=200000, help='frames sent on every channel')
+    p.set_defaults(func=bench_multibus)
+
+    p = sub.add_parser('tach', help='rpm bar paint cost, stylesheet QProgressBar against TachometerWidget')
+    p.add_argument('-t', '--seconds', type=float, default=10, help='seconds of 60 fps rev sweep')
+    p.add_argument('--width', type=int, default=800)
+    p.set_defaults(func=bench_tach)
+
+    p = sub.add_parser('binlog', help='DataLogger CSV against binary log size and load time')
+    p.add_argument('-n', '--rows', type=int, default=360000, help='rows, 100 per second of driving')
+    p.set_defaults(func=bench_binlog)
+
+    p = sub.add_parser('record', help='raw frame recorder under a saturated bus')
+    p.add_argument('-n', '--frames', type=int, default=90000)
+    p.add_argument('--rate', type=float, default=9000, help='frames per second on the bus')
+    p.set_defaults(func=bench_record)
+
+    p = sub.add_parser('seek', help='time window extraction from a segmented session')
+    p.add_argument('--hours', type=float, default=4)
+    p.add_argument('--rate', type=float, default=2000, help='frames per second recorded')
+    p.add_argument('--segment-seconds', type=float, default=60)
+    p.add_argument('--lap', type=float, default=90, help='seconds in the window')
+    p.set_defaults(func=bench_seek)
+
+    p = sub.add_parser('laptiming', help='lap timer update cost, grid index against checking every gate')
+    p.add_argument('--gates', type=int, default=500, help='microsegment gates')
+    p.add_argument('--length', type=float, default=4000, help='track length in meters')
+    p.add_argument('--lap-seconds', type=float, default=100)
+    p.add_argument('--laps', type=int, default=3)
+    p.set_defaults(func=bench_laptiming)
+
+    p = sub.add_parser('gear', help='gear detection, ratio scan against bisection, live against vectorized')
+    p.add_argument('-t', '--seconds', type=float, default=600, help='seconds of driving')
+    p.add_argument('--shift-seconds', type=float, default=5)
+    p.set_defaults(func=bench_gear)
+
+    args = parser.parse_args()
+    if args.bench == 'multibus' and not args.channel:
+        args.channel = ['vcan0=0x201,0x231', 'vcan1']
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
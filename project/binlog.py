@@ -0,0 +1,96 @@
+import json, math, struct
+import numpy as np
+
+# Binary DataLogger format.
+#
+#   magic             8 bytes, b'CANDLOG1'
+#   header length     uint32 little endian
+#   header            JSON: {"version": 1, "fields": [[name, dtype], ...]},
+#                     space padded so records start 8 byte aligned
+#   records           fixed width little endian records, time first
+#
+# Loggables still hand over strings through get_log_data; they are converted
+# to the column types here (float64 unless the loggable's get_log_types says
+# otherwise, e.g. u1 for flags, f4 for CAN values), with anything
+# non-numeric, like the 'n' gear, stored as NaN. Rows with fewer values than
+# labels are padded with NaN; integer columns store NaN as 0. A file cut
+# short by a crash only loses the trailing partial record.
+
+magic = b'CANDLOG1'
+version = 1
+
+
+def make_dtype(labels, types={}):
+    return np.dtype([('time', '<f8')] + [(l, types.get(l, '<f8')) for l in labels])
+
+
+def header(dtype):
+    meta = json.dumps({'version': version, 'fields': [[name, dtype[name].str] for name in dtype.names]})
+    length = len(meta) + (-(len(magic) + 4 + len(meta)) % 8)
+    return magic + struct.pack('<I', length) + meta.ljust(length).encode()
+
+
+def _number(s):
+    try:
+        return float(s)
+    except ValueError:
+        return math.nan
+
+
+def encode_rows(rows, dtype):
+    # rows of (time, [strings]) to record bytes
+    width = len(dtype.names) - 1
+    flat = []
+    for t, data in rows:
+        try:
+            values = list(map(float, data))
+        except ValueError:
+            values = [_number(v) for v in data]
+        flat.append(t)
+        flat.extend(values)
+        if len(data) < width:
+            flat.extend([math.nan] * (width - len(data)))
+    values = np.array(flat, dtype=np.float64).reshape(len(rows), width + 1)
+
+    records = np.empty(len(rows), dtype=dtype)
+    for i, name in enumerate(dtype.names):
+        column = values[:, i]
+        if dtype[name].kind in 'biu':
+            column = np.nan_to_num(column, nan=0.)
+        records[name] = column
+    return records.tobytes()
+
+
+def read_header(file):
+    if file.read(len(magic)) != magic:
+        raise ValueError('Not a binary DataLogger file')
+    length, = struct.unpack('<I', file.read(4))
+    meta = json.loads(file.read(length))
+    if meta['version'] != version:
+        raise ValueError(f'Unsupported binary log version {meta["version"]}')
+    return np.dtype([tuple(f) for f in meta['fields']]), len(magic) + 4 + length
+
+
+def parse_csv(data, names):
+    # DataLogger CSV lines (bytes) to a structured array like read_log,
+    # through the same conversion as the binary writer
+    dtype = make_dtype(names[1:])
+    rows = [line.split(',') for line in data.decode().splitlines() if line]
+    return np.frombuffer(encode_rows([(float(r[0]), r[1:len(names)]) for r in rows], dtype), dtype=dtype)
+
+
+def read_csv(filename):
+    with open(filename, 'rb') as file:
+        names = file.readline().decode().strip().split(',')
+        return parse_csv(file.read(), names)
+
+
+def read_log(filename):
+    # memory mapped structured array, one field per column
+    with open(filename, 'rb') as file:
+        dtype, offset = read_header(file)
+        file.seek(0, 2)
+        count = (file.tell() - offset) // dtype.itemsize
+    if not count:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(filename, dtype=dtype, mode='r', offset=offset, shape=(count,))
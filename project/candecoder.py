@@ -1,10 +1,15 @@
 from collections import namedtuple
 import abc, can
+import numpy as np
 import canmanager
 
 # correction factor for inaccurate speedo
 speed_correction = 1.0262
 
+# columnar decode result: timestamp array plus the decoder's result namedtuple
+# holding one array per field
+BatchResult = namedtuple('BatchResult', ['timestamp', 'fields'])
+
 class CanMessageDecoder(abc.ABC):
     @property
     @classmethod
@@ -12,6 +17,9 @@ class CanMessageDecoder(abc.ABC):
     def id():
         pass
 
+    # True for 29 bit identifiers
+    extended = False
+
     def __init__(self, id):
         pass
 
@@ -20,6 +28,18 @@ class CanMessageDecoder(abc.ABC):
     def decode(self, can_message: can.Message):
         pass
 
+    @classmethod
+    def decode_batch(cls, data, timestamps) -> BatchResult:
+        # data is an (N, 8) uint8 array of payloads, zero padded for short frames
+        data = np.asarray(data, dtype=np.uint8).reshape(-1, 8)
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        return BatchResult(timestamps, cls.result(*cls.decode_columns(data)))
+
+    @classmethod
+    @abc.abstractmethod
+    def decode_columns(cls, data):
+        pass
+
 
 def unimplemented_CanDecoder_factory(canid) -> CanMessageDecoder:
     
@@ -33,6 +53,13 @@ def unimplemented_CanDecoder_factory(canid) -> CanMessageDecoder:
         def decode(cls, data):
             return cls.result(data)
 
+        @classmethod
+        def decode_columns(cls, data):
+            return (data,)
+
+    # module level name, so the class pickles by reference into worker processes
+    UnimplementedCanDecoder.__name__ = UnimplementedCanDecoder.__qualname__ = f'Can{canid:X}Decoder'
+
     return UnimplementedCanDecoder
 
 
@@ -48,6 +75,11 @@ class Can200Decoder(CanMessageDecoder):
         brake = bool(data[6] & 0x1)
         return cls.result(brake, data)
 
+    @classmethod
+    def decode_columns(cls, data):
+        brake = (data[:, 6] & 0x1).astype(bool)
+        return brake, data
+
 class Can201Decoder(CanMessageDecoder):
 
     result = namedtuple('Can201Result', ['rpm', 'speed', 'accpos', 'can201unknown1', 'can201total'])
@@ -63,6 +95,16 @@ class Can201Decoder(CanMessageDecoder):
         can201unknown1 = (data[2] * 255 + data[3]) - 0x7fff
         return cls.result(rpm, speed, accpos, can201unknown1, data)
 
+    @classmethod
+    def decode_columns(cls, data):
+        d = data.astype(np.int32)
+        rpm = (d[:, 0] * 255 + d[:, 1])/4.
+        speed = (d[:, 4] * 255 + d[:, 5])/100. - 100.
+        speed = speed * speed_correction
+        accpos = d[:, 6]/2.0
+        can201unknown1 = (d[:, 2] * 255 + d[:, 3]) - 0x7fff
+        return rpm, speed, accpos, can201unknown1, data
+
 Can211Decoder = unimplemented_CanDecoder_factory(0x211)
 Can212Decoder = unimplemented_CanDecoder_factory(0x212)
 Can215Decoder = unimplemented_CanDecoder_factory(0x215)
@@ -80,6 +122,12 @@ class Can231Decoder(CanMessageDecoder):
         clutch = bool(0x02 & data[1])
         return cls.result(clutch, gearneutral, data)
 
+    @classmethod
+    def decode_columns(cls, data):
+        gearneutral = (0x04 & data[:, 1]) != 0
+        clutch = (0x02 & data[:, 1]) != 0
+        return clutch, gearneutral, data
+
 class Can240Decoder(CanMessageDecoder):
 
     result = namedtuple('Can240Result', 
@@ -96,5 +144,15 @@ class Can240Decoder(CanMessageDecoder):
         iat = data[4]-40
         return cls.result(calcload, ect, can240unknown1, throttlevalve, iat, data)
 
+    @classmethod
+    def decode_columns(cls, data):
+        d = data.astype(np.int32)
+        calcload = 100*d[:, 0]/255.00
+        ect = d[:, 1]-40
+        can240unknown1 = d[:, 2]
+        throttlevalve = 100*d[:, 3]/255.00
+        iat = d[:, 4]-40
+        return calcload, ect, can240unknown1, throttlevalve, iat, data
+
 Can420Decoder = unimplemented_CanDecoder_factory(0x420)
 Can430Decoder = unimplemented_CanDecoder_factory(0x430)
@@ -0,0 +1,214 @@
+from collections import namedtuple
+import mmap, os
+import numpy as np
+
+# Reader for candump -l style logs:
+#   (1680000000.123456) can0 201#0102030405060708
+#
+# Lines are parsed in bulk with NumPy over a memory mapped file instead of a
+# regex per line. Lines that are not classic data frames (comments, remote
+# frames, CAN FD '##' frames, truncated lines) are skipped.
+
+Frames = namedtuple('Frames', ['timestamp', 'id', 'dlc', 'data'])
+
+# set in Frames.id for extended (29 bit) IDs, as in socketcan's canid_t
+CAN_EFF_FLAG = 0x80000000
+
+default_chunk_size = 64 * 1024 * 1024
+
+# lookup tables mapping characters to digit values, 0xff marks invalid
+_hex_table = np.full(256, 0xff, dtype=np.uint8)
+for i, c in enumerate(b'0123456789abcdef'):
+    _hex_table[c] = i
+for i, c in enumerate(b'ABCDEF'):
+    _hex_table[c] = 10 + i
+
+_digit_table = np.full(256, 0xff, dtype=np.uint8)
+for i, c in enumerate(b'0123456789'):
+    _digit_table[c] = i
+
+
+def empty_frames() -> Frames:
+    return Frames(np.empty(0, dtype=np.float64), np.empty(0, dtype=np.uint32),
+        np.empty(0, dtype=np.uint8), np.empty((0, 8), dtype=np.uint8))
+
+
+def concatenate_frames(chunks) -> Frames:
+    chunks = list(chunks)
+    if not chunks:
+        return empty_frames()
+    return Frames(*(np.concatenate(cols) for cols in zip(*chunks)))
+
+
+def _position_in_line(buf, char, starts, nlines):
+    # position of the last occurrence of char in every line, and how many
+    # times it occurs there
+    pos = np.flatnonzero(buf == ord(char))
+    line = np.searchsorted(starts, pos, side='right') - 1
+    count = np.bincount(line, minlength=nlines)
+    last = np.zeros(nlines, dtype=np.int64)
+    last[line] = pos
+    return last, count
+
+
+def _line_matrix(buf, starts, width):
+    # (N, width) view of lines that share a layout; zero copy when the lines
+    # are evenly spaced, which is the common case for candump logs
+    if len(starts) > 1:
+        stride = starts[1] - starts[0]
+        if stride >= width and np.all(np.diff(starts) == stride):
+            return np.lib.stride_tricks.as_strided(buf[starts[0]:], shape=(len(starts), width),
+                strides=(stride * buf.strides[0], buf.strides[0]), writeable=False)
+    return buf[starts[:, None] + np.arange(width)]
+
+
+def _all_below(values, limit):
+    # per row check, skipped when the whole matrix is fine
+    if not values.size or values.max() < limit:
+        return np.ones(len(values), dtype=bool)
+    return np.all(values < limit, axis=1)
+
+
+def _parse_digits(chars, table, base):
+    values = table[chars]
+    ok = _all_below(values, base)
+    weights = float(base) ** np.arange(chars.shape[1] - 1, -1, -1)
+    return values @ weights, ok
+
+
+def _parse_layout(lines, close, hashes):
+    # parse lines that all have ')' at close and '#' at hashes
+    n, width = lines.shape
+    first = lines[0]
+
+    dot = bytes(first[:close]).rfind(b'.')
+    space = bytes(first[:hashes]).rfind(b' ')
+    data_len = width - hashes - 1
+    id_len = hashes - space - 1
+    if dot < 2 or space <= close or data_len % 2 or data_len > 16 or not 1 <= id_len <= 8:
+        return None
+
+    ok = (lines[:, 0] == ord('(')) & (lines[:, dot] == ord('.')) & (lines[:, space] == ord(' '))
+
+    seconds, ok_int = _parse_digits(lines[:, 1:dot], _digit_table, 10)
+    fraction, ok_frac = _parse_digits(lines[:, dot + 1:close], _digit_table, 10)
+    timestamp = seconds + fraction / 10.0 ** (close - dot - 1)
+
+    canid, ok_id = _parse_digits(lines[:, space + 1:hashes], _hex_table, 16)
+    if id_len == 8:
+        # candump writes extended IDs with 8 digits; flagged as in socketcan
+        canid = canid + CAN_EFF_FLAG
+
+    nibbles = _hex_table[lines[:, hashes + 1:]]
+    ok_data = _all_below(nibbles, 16)
+    data = np.zeros((n, 8), dtype=np.uint8)
+    data[:, :data_len // 2] = nibbles[:, 0::2] * 16 + nibbles[:, 1::2]
+
+    ok &= ok_int & ok_frac & ok_id & ok_data
+    return timestamp, canid.astype(np.uint32), data_len // 2, data, ok
+
+
+def parse_buffer(buf) -> Frames:
+    buf = np.asarray(buf, dtype=np.uint8)
+    if not len(buf):
+        return empty_frames()
+
+    ends = np.flatnonzero(buf == ord('\n'))
+    if not len(ends) or ends[-1] != len(buf) - 1:
+        ends = np.append(ends, len(buf))
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    nlines = len(starts)
+
+    # strip \r of \r\n line endings
+    ends = ends - ((ends > starts) & (buf[np.maximum(ends - 1, 0)] == ord('\r')))
+
+    close, close_count = _position_in_line(buf, ')', starts, nlines)
+    hashes, hash_count = _position_in_line(buf, '#', starts, nlines)
+
+    valid = (close_count == 1) & (hash_count == 1) & (close > starts) & (hashes > close)
+    starts, close, hashes, ends = (a[valid] for a in (starts, close, hashes, ends))
+    if not len(starts):
+        return empty_frames()
+
+    # lines sharing the positions of ')', '#' and the line end are parsed
+    # together as one (N, width) character matrix
+    layout = ((close - starts) << 42) | ((hashes - starts) << 21) | (ends - starts)
+    if np.all(layout == layout[0]):
+        groups = [np.arange(len(starts))]
+    else:
+        order = np.argsort(layout, kind='stable')
+        split = np.flatnonzero(np.diff(layout[order])) + 1
+        groups = np.split(order, split)
+
+    n = len(starts)
+    timestamp = np.zeros(n, dtype=np.float64)
+    canid = np.zeros(n, dtype=np.uint32)
+    dlc = np.zeros(n, dtype=np.uint8)
+    data = np.zeros((n, 8), dtype=np.uint8)
+    ok = np.zeros(n, dtype=bool)
+
+    for group in groups:
+        i = group[0]
+        lines = _line_matrix(buf, starts[group], ends[i] - starts[i])
+        parsed = _parse_layout(lines, close[i] - starts[i], hashes[i] - starts[i])
+        if parsed is None:
+            continue
+        timestamp[group], canid[group], dlc[group], data[group], ok[group] = parsed
+
+    return Frames(timestamp[ok], canid[ok], dlc[ok], data[ok])
+
+
+def split_ranges(filename, n):
+    # n byte ranges (start, stop) covering the file, cut at line boundaries
+    size = os.path.getsize(filename)
+    if not size:
+        return []
+
+    with open(filename, 'rb') as file, \
+            mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        bounds = [0]
+        for i in range(1, n):
+            cut = mm.find(b'\n', max(size * i // n, bounds[-1]))
+            cut = size if cut < 0 else cut + 1
+            if cut >= size:
+                break
+            if cut > bounds[-1]:
+                bounds.append(cut)
+        bounds.append(size)
+
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def iter_chunks(filename, chunk_size=default_chunk_size, start=0, stop=None):
+    # streaming mode: yields Frames per chunk of roughly chunk_size bytes,
+    # split at line boundaries, so memory stays bounded for any file size.
+    # start and stop restrict reading to a line aligned byte range.
+    size = os.path.getsize(filename)
+    stop = size if stop is None else min(stop, size)
+    if start >= stop:
+        return
+
+    with open(filename, 'rb') as file, \
+            mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        pos = start
+        while pos < stop:
+            end = min(pos + chunk_size, stop)
+            if end < stop:
+                cut = mm.rfind(b'\n', pos, end)
+                if cut < 0:
+                    # single line longer than a chunk
+                    cut = mm.find(b'\n', end, stop)
+                end = stop if cut < 0 else cut + 1
+
+            buf = np.frombuffer(mm, dtype=np.uint8, count=end - pos, offset=pos)
+            frames = parse_buffer(buf)
+            # release the view so the mmap can be closed
+            del buf
+            pos = end
+            yield frames
+
+
+def read_candump(filename, chunk_size=default_chunk_size, start=0, stop=None) -> Frames:
+    return concatenate_frames(iter_chunks(filename, chunk_size, start, stop))
@@ -0,0 +1,102 @@
+import itertools
+
+import candump
+
+# Minimal kernel filter sets.
+#
+# A CAN_RAW filter passes a frame when (frame id & can_mask) == (can_id &
+# can_mask), so one filter with some mask bits cleared covers a whole block
+# of IDs. The registered IDs are merged into such blocks Quine-McCluskey
+# style: two blocks that differ in exactly one cared-about bit become one
+# block without that bit, until nothing merges any more. Every block only
+# ever contains registered IDs, so the chosen filters pass exactly those IDs
+# and no others. Then as few blocks as possible are picked to cover all IDs.
+#
+# Standard (11 bit) and extended (29 bit) IDs get separate filters; the
+# extended flag is part of every filter, so neither kind leaks into the
+# other.
+
+standard_mask = 0x7ff
+extended_mask = 0x1fffffff
+
+# remaining choices up to this many blocks are searched for the smallest
+# cover, more are covered greedily
+exact_cover_limit = 16
+
+
+def _prime_blocks(ids, width_mask):
+    # (value, dontcare) blocks of registered IDs that cannot grow further
+    blocks = {(i, 0) for i in ids}
+    primes = set()
+    while blocks:
+        merged = set()
+        used = set()
+        values = {}
+        for value, dontcare in blocks:
+            values.setdefault(dontcare, set()).add(value)
+        for dontcare, group in values.items():
+            free = width_mask & ~dontcare
+            for value in group:
+                bit = 1
+                while bit <= free:
+                    if free & bit and not value & bit and value | bit in group:
+                        merged.add((value, dontcare | bit))
+                        used.add((value, dontcare))
+                        used.add((value | bit, dontcare))
+                    bit <<= 1
+        primes |= blocks - used
+        blocks = merged
+    return primes
+
+
+def _cover(blocks, ids):
+    # as few blocks as possible covering all ids
+    covers = {b: frozenset(i for i in ids if i & ~b[1] == b[0]) for b in blocks}
+    chosen = []
+    left = set(ids)
+
+    # IDs in only one block need that block
+    for i in ids:
+        owners = [b for b in blocks if i in covers[b]]
+        if len(owners) == 1 and owners[0] not in chosen:
+            chosen.append(owners[0])
+    for b in chosen:
+        left -= covers[b]
+
+    candidates = sorted(b for b in blocks if b not in chosen and covers[b] & left)
+    if left and len(candidates) <= exact_cover_limit:
+        for k in range(1, len(candidates) + 1):
+            for combo in itertools.combinations(candidates, k):
+                if left <= frozenset().union(*(covers[b] for b in combo)):
+                    return chosen + list(combo)
+
+    while left:
+        best = max(candidates, key=lambda b: len(covers[b] & left))
+        chosen.append(best)
+        left -= covers[best]
+    return chosen
+
+
+def minimal_filters(ids, extended=False):
+    # python-can style filter dicts passing exactly ids
+    width_mask = extended_mask if extended else standard_mask
+    ids = sorted(set(ids))
+    for i in ids:
+        if i & ~width_mask:
+            raise ValueError(f'CAN ID {i:#x} does not fit in {"29" if extended else "11"} bits')
+    blocks = _cover(_prime_blocks(ids, width_mask), ids)
+    return [{"can_id": value, "can_mask": width_mask & ~dontcare, "extended": extended}
+        for value, dontcare in sorted(blocks)]
+
+
+def filters_for(decoders):
+    # minimal filters for the IDs of decoders, standard and extended
+    decoders = list(decoders)
+    standard = [d.id for d in decoders if not getattr(d, 'extended', False)]
+    extended = [d.id for d in decoders if getattr(d, 'extended', False)]
+    return (minimal_filters(standard) if standard else []) + (minimal_filters(extended, True) if extended else [])
+
+
+def frame_id(decoder):
+    # the decoder's ID as found in Frames.id
+    return decoder.id | candump.CAN_EFF_FLAG if getattr(decoder, 'extended', False) else decoder.id
@@ -1,40 +1,224 @@
 import can
 import abc
-import time, logging
+import asyncio, time, logging
+import numpy as np
+import socketcanrx, canfilter
+
+
+def parse_id(text):
+    # frame ID from a command line CAN ID, 0x201 or 513; as in candump logs
+    # an ID written with 8 hex digits, or one over 11 bits, is extended
+    digits = text.lower().removeprefix('0x')
+    canid = int(digits, 16) if len(digits) == 8 else int(text, 0)
+    if len(digits) == 8 or canid > canfilter.standard_mask:
+        canid |= socketcanrx.CAN_EFF_FLAG
+    return canid
+
+
+def assign_decoders(specs, decoders):
+    # {channel: decoders} from command line specs 'channel' or
+    # 'channel=ID,ID,...'; the first channel without IDs gets every decoder
+    # not claimed by another channel, further ones none. Every ID is decoded
+    # on one bus only, the store keeps a single writer per ID.
+    wanted = {}
+    for spec in specs:
+        channel, _, ids = spec.partition('=')
+        wanted[channel] = [parse_id(i) for i in ids.split(',')] if ids else None
+    by_id = {canfilter.frame_id(d): d for d in decoders}
+    claimed = {}
+    for channel, ids in wanted.items():
+        for i in ids or ():
+            if i in claimed:
+                raise ValueError(f'CAN ID {i:#x} assigned to both {claimed[i]} and {channel}')
+            claimed[i] = channel
+    unknown = claimed.keys() - by_id.keys()
+    if unknown:
+        raise ValueError(f'No decoder for CAN IDs {", ".join(hex(i) for i in sorted(unknown))}')
+    bare = [channel for channel, ids in wanted.items() if not ids]
+    return {channel: [by_id[i] for i in ids] if ids else
+        [d for d in decoders if canfilter.frame_id(d) not in claimed] if channel == bare[0] else []
+        for channel, ids in wanted.items()}
+
 
 class CanBusManager():
-    def __init__(self, channel, posthook=None, interface='socketcan', decoders=[]):
-        self._bus = can.interface.Bus(channel=channel, interface=interface)
-        self.decoders = {d.id : d for d in decoders}
-        self._bus.set_filters([self.filter_from_decoder(d) for d in decoders])
+    # channel is one channel name or a list of them, decoders a list used on
+    # the first channel or a dict {channel: decoders} with every decoder on
+    # one channel at most (see assign_decoders). Each channel is received
+    # independently on its own thread (or its own reader in asyncio mode)
+    # and every update is passed on with its channel as bus and its bus
+    # timestamp, so one store can merge all buses.
+    #
+    # backend 'notifier' receives through python-can, 'bulk' reads socketcan
+    # in batches with socketcanrx
+    def __init__(self, channel, posthook=None, interface='socketcan', decoders=[], raw_posthook=None,
+            backend='notifier', batch_posthook=None, loop=None):
+        channels = [channel] if isinstance(channel, str) else list(channel)
+        if not isinstance(decoders, dict):
+            decoders = {c: decoders if i == 0 else [] for i, c in enumerate(channels)}
+        # a decoder on two buses would have two threads writing its store
+        # group and feeding the gear detector
+        owner = {}
+        for c in channels:
+            for d in decoders[c]:
+                if owner.setdefault(d, c) != c:
+                    raise ValueError(f'Decoder {d.__name__} on both {owner[d]} and {c}')
+
+        # posthook(data, timestamp, bus)
         self.posthook = posthook
+        # when set, frames are handed over undecoded as
+        # raw_posthook(canid, data, timestamp, bus) and posthook is skipped
+        self.raw_posthook = raw_posthook
+        # bulk backend only: batch_posthook(frames, bus) with every received
+        # batch as columnar Frames
+        self.batch_posthook = batch_posthook
+        # optional framelog.FrameRecorder, gets every received data frame of
+        # every bus
+        self.recorder = None
+        # optional instrumentation.Instrumentation, records decode latency
+        self.instrumentation = None
         self.can_last_live = 0
 
-        custom_listener = CanBusManagerListener(self)
+        if backend == 'bulk' and interface != 'socketcan':
+            raise ValueError('The bulk backend only supports socketcan')
+        self.buses = [CanBus(self, c, decoders[c], interface, backend, loop) for c in channels]
+        # by frame ID, extended IDs with CAN_EFF_FLAG as in Frames.id
+        self.decoders = {i: d for bus in self.buses for i, d in bus.decoders.items()}
 
-        self.notifier = can.Notifier(self._bus, listeners=[custom_listener])
-        
-    
+        self._rate_started = time.monotonic()
+        self._rate_counts = [0] * len(self.buses)
+
+    async def receive(self):
+        await asyncio.gather(*(bus.receive() for bus in self.buses))
+
+    def stop(self):
+        for bus in self.buses:
+            bus.stop()
+
+    def throughput(self):
+        # {channel: frames per second} received since the last call
+        now = time.monotonic()
+        elapsed = max(now - self._rate_started, 1e-9)
+        rates = {}
+        for i, bus in enumerate(self.buses):
+            count = bus.frames_received
+            rates[bus.channel] = (count - self._rate_counts[i]) / elapsed
+            self._rate_counts[i] = count
+        self._rate_started = now
+        return rates
 
     @staticmethod
-    def filter_from_decoder(decoder, extended=False):
+    def filter_from_decoder(decoder, extended=None):
+        # exact match filter for one decoder; CanBus uses the merged
+        # canfilter.filters_for() set instead
+        if extended is None:
+            extended = decoder.extended
         if extended:
             mask = 0x1fffffff # 29 bits
         else:
             mask = 0x7ff # 11 bits
         return {"can_id": decoder.id, "can_mask": mask, "extended": extended}
-    
+
+
+class CanBus():
+    # one channel of a CanBusManager, with its own decoders and kernel filters;
+    # the kernel passes exactly the decoded IDs through a minimal filter set
+    # and frames are routed by frame ID (canfilter.frame_id), which is also
+    # the canid handed to raw_posthook
+
+    def __init__(self, manager, channel, decoders, interface, backend, loop):
+        self.manager = manager
+        self.channel = channel
+        self.decoders = {canfilter.frame_id(d): d for d in decoders}
+        self.filters = filters = canfilter.filters_for(decoders)
+        self.frames_received = 0
+
+        if backend == 'bulk':
+            self._bus = None
+            self.notifier = None
+            self.reader = None
+            self.receiver = socketcanrx.BulkSocketcanReceiver(channel, filters, on_batch=self.on_batch)
+            self.receiver.start()
+            return
+
+        self._bus = can.interface.Bus(channel=channel, interface=interface)
+        self._bus.set_filters(filters)
+        self.receiver = None
+
+        self.listener = CanBusManagerListener(manager, self)
+
+        if loop:
+            # asyncio mode: the notifier watches the socket from the event
+            # loop and receive() dispatches from there, no receive thread
+            self.reader = can.AsyncBufferedReader()
+            self.notifier = can.Notifier(self._bus, listeners=[self.reader], loop=loop)
+        else:
+            self.reader = None
+            self.notifier = can.Notifier(self._bus, listeners=[self.listener])
+
+    async def receive(self):
+        if not self.reader:
+            return
+        async for mesg in self.reader:
+            self.listener.on_message_received(mesg)
+
+    def stop(self):
+        if self.reader:
+            self.reader.stop()
+        if self.receiver:
+            self.receiver.stop()
+        if self.notifier:
+            self.notifier.stop()
+            self._bus.shutdown()
+
+    def on_batch(self, frames):
+        manager = self.manager
+        self.frames_received += len(frames.id)
+        if manager.recorder:
+            manager.recorder.record_batch(frames)
+        if manager.batch_posthook:
+            manager.batch_posthook(frames, bus=self.channel)
+
+        # the display only keeps the latest value per ID, so only the last
+        # frame of each ID in the batch goes through the per frame hooks
+        ids, last = np.unique(frames.id[::-1], return_index=True)
+        last = len(frames.id) - 1 - last
+        for canid, i in zip(ids.tolist(), last.tolist()):
+            decoder = self.decoders.get(canid)
+            if decoder is None:
+                logging.warning(f"Unhandled CAN ID {canid:#x} on {self.channel}")
+                continue
+            payload = frames.data[i, :frames.dlc[i]].tobytes()
+            timestamp = float(frames.timestamp[i])
+            if manager.raw_posthook:
+                manager.raw_posthook(canid=canid, data=payload, timestamp=timestamp, bus=self.channel)
+            elif manager.posthook:
+                data = decoder.decode(payload)
+                if manager.instrumentation:
+                    manager.instrumentation.record('decode', f'{canid:03X}', timestamp)
+                manager.posthook(data=data, timestamp=timestamp, bus=self.channel)
+
 
 class CanBusManagerListener(can.Listener):
-    def __init__(self, manager: CanBusManager):
+    def __init__(self, manager: CanBusManager, bus: CanBus):
         self.manager = manager
-    
+        self.bus = bus
+
     def on_message_received(self, mesg: can.Message):
-        if mesg.arbitration_id in self.manager.decoders:
-            decoder = self.manager.decoders[mesg.arbitration_id]
+        self.bus.frames_received += 1
+        # extended IDs carry CAN_EFF_FLAG, as from the bulk receiver
+        canid = mesg.arbitration_id | socketcanrx.CAN_EFF_FLAG if mesg.is_extended_id else mesg.arbitration_id
+        if self.manager.recorder and not (mesg.is_error_frame or mesg.is_remote_frame):
+            self.manager.recorder.record(canid, mesg.data, mesg.timestamp)
+        decoder = self.bus.decoders.get(canid)
+        if decoder:
+            if self.manager.raw_posthook:
+                self.manager.raw_posthook(canid=canid, data=mesg.data, timestamp=mesg.timestamp,
+                    bus=self.bus.channel)
+                return
             data = decoder.decode(mesg.data)
+            if self.manager.instrumentation:
+                self.manager.instrumentation.record('decode', f'{canid:03X}', mesg.timestamp)
             if self.manager.posthook:
-                self.manager.posthook(data=data, timestamp=mesg.timestamp)
+                self.manager.posthook(data=data, timestamp=mesg.timestamp, bus=self.bus.channel)
         else:
-            logging.warning(f"Unhandled CAN ID {mesg.arbitration_id}")
-    
+            logging.warning(f"Unhandled CAN ID {canid:#x} on {self.bus.channel}")
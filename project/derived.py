@@ -0,0 +1,129 @@
+from collections import namedtuple
+import graphlib
+import numpy as np
+
+import gear
+
+# Derived channels: math on decoded signals.
+#
+# A channel names its inputs (decoder result fields, 'gear' from the
+# GearDetector, or other channels) and a function of them. DerivedChannels
+# sorts the channels topologically once. update() takes the latest input
+# values and only recomputes the channels downstream of an input whose
+# value changed, in dependency order. evaluate() runs the same channels over
+# whole arrays for offline analysis.
+#
+# A new channel is one more entry in channels below; the DataLogger writes
+# every channel with log set, the display and offline analysis look results
+# up by name.
+
+kph_to_mph = 0.621371
+
+# rpm of the red, flashing shift light
+revlimit2 = 6800
+# yellow shift light in first gear and neutral
+default_revlimit1 = 5000
+
+# shiftlight channel values, by index
+shiftlight_bands = ('blue', 'yellow', 'red')
+
+
+class Channel(namedtuple('Channel', ['name', 'inputs', 'compute', 'vectorized', 'log', 'log_type'],
+        defaults=[None, True, '<f4'])):
+    # compute(*inputs) on scalars, vectorized(*inputs) on arrays; compute is
+    # used for both when it is plain arithmetic. log: written by DataLogger,
+    # as log_type in binary logs
+    pass
+
+
+def _revlimit1(g):
+    # rpm in this gear that lands at revlimit2 rpm after the next upshift
+    if g == gear.neutral or g < 2:
+        return default_revlimit1
+    return revlimit2 * gear.ref_gear_ratios[g - 1] / gear.ref_gear_ratios[g - 2]
+
+
+def _revlimit1_array(g):
+    # offline gears are 0 for neutral
+    g = np.asarray(g, dtype=np.int64)
+    ratios = np.array(gear.ref_gear_ratios)
+    i = np.clip(g, 2, len(ratios))
+    return np.where(g > 1, revlimit2 * ratios[i - 1] / ratios[i - 2], float(default_revlimit1))
+
+
+def _shiftlight(rpm, revlimit1):
+    return 2 if rpm > revlimit2 else 1 if rpm > revlimit1 else 0
+
+
+def _shiftlight_array(rpm, revlimit1):
+    return np.select([rpm > revlimit2, rpm > revlimit1], [2, 1], 0)
+
+
+channels = [
+    Channel('mph', ['speed'], lambda speed: abs(speed * kph_to_mph)),
+    Channel('revlimit1', ['gear'], _revlimit1, _revlimit1_array),
+    Channel('shiftlight', ['rpm', 'revlimit1'], _shiftlight, _shiftlight_array, log_type='|u1'),
+]
+
+
+class DerivedChannels():
+
+    def __init__(self, channels=channels):
+        by_name = {c.name: c for c in channels}
+        # raises graphlib.CycleError on circular definitions
+        graph = {c.name: [i for i in c.inputs if i in by_name] for c in channels}
+        self.order = [by_name[name] for name in graphlib.TopologicalSorter(graph).static_order()]
+        # inputs that are not channels themselves, fed to update()
+        self.sources = sorted({i for c in channels for i in c.inputs if i not in by_name})
+
+        # positions in order of the channels reading each input
+        self._dependents = {}
+        for k, c in enumerate(self.order):
+            for i in c.inputs:
+                self._dependents.setdefault(i, []).append(k)
+
+        # logged channels, in evaluation order
+        self.logged = [c.name for c in self.order if c.log]
+
+        self.values = dict.fromkeys(self.sources + [c.name for c in self.order])
+        self._dirty = [True] * len(self.order)
+        self.evaluations = 0
+
+    def update(self, sources):
+        # sources: mapping holding at least every name in self.sources;
+        # returns the values of all sources and channels
+        values = self.values
+        dirty = self._dirty
+        dependents = self._dependents
+        for name in self.sources:
+            v = sources[name]
+            if v != values[name]:
+                values[name] = v
+                for k in dependents.get(name, ()):
+                    dirty[k] = True
+
+        # dependents always come later in the order
+        for k, c in enumerate(self.order):
+            if not dirty[k]:
+                continue
+            dirty[k] = False
+            v = c.compute(*[values[i] for i in c.inputs])
+            self.evaluations += 1
+            if v != values[c.name]:
+                values[c.name] = v
+                for j in dependents.get(c.name, ()):
+                    dirty[j] = True
+        return values
+
+    def evaluate(self, arrays):
+        # {channel: array} from {source: array} sampled at the same times
+        values = dict(arrays)
+        for c in self.order:
+            values[c.name] = (c.vectorized or c.compute)(*[values[i] for i in c.inputs])
+        return {c.name: values[c.name] for c in self.order}
+
+    def evaluate_traces(self, traces):
+        # {channel: (timestamps, values)} from {field: (timestamp, values)}
+        # traces, on the union of the sources' timestamps
+        t, *values = gear.merge_inputs(traces, self.sources)
+        return {name: (t, v) for name, v in self.evaluate(dict(zip(self.sources, values))).items()}
@@ -0,0 +1,108 @@
+import argparse, datetime, json, math, socket, threading, time
+
+import gpsreader
+
+# Minimal stand in for gpsd, for exercising GPSReader and the dashboard
+# without a receiver: answers WATCH with a stream of TPV reports.
+#
+#   python fakegpsd.py --port 2947 --lat 37.9 --lon -122.3
+#
+# fixes is any callable returning a TPV dict for a given time, e.g.
+# circle_track(); reports go out at rate_hz to every connected client.
+
+earth_radius = 6371000.
+
+
+def circle_track(lat, lon, radius=200., lap_seconds=60.):
+    # a car driving laps around (lat, lon)
+    def fix(t):
+        a = 2 * math.pi * (t % lap_seconds) / lap_seconds
+        return {'class': 'TPV', 'mode': 3,
+            'time': datetime.datetime.fromtimestamp(t, datetime.timezone.utc).isoformat().replace('+00:00', 'Z'),
+            'lat': lat + math.degrees(radius * math.sin(a) / earth_radius),
+            'lon': lon + math.degrees(radius * math.cos(a) / (earth_radius * math.cos(math.radians(lat)))),
+            'speed': 2 * math.pi * radius / lap_seconds, 'track': math.degrees(-a) % 360}
+    return fix
+
+
+class FakeGpsd():
+
+    def __init__(self, fixes, host=gpsreader.default_host, port=0, rate_hz=10.):
+        self.fixes = fixes
+        self.rate_hz = rate_hz
+        self.server = socket.create_server((host, port))
+        # port 0 picks a free one
+        self.host, self.port = self.server.getsockname()[:2]
+        self.clients = []
+        self.reports_sent = 0
+        self._running = False
+
+    def _accept(self):
+        while self._running:
+            try:
+                client, _ = self.server.accept()
+            except OSError:
+                return
+            client.sendall(b'{"class":"VERSION","release":"fake","proto_major":3,"proto_minor":14}\n')
+            thread = threading.Thread(target=self._serve, args=(client,), daemon=True)
+            thread.start()
+
+    def _serve(self, client):
+        with client:
+            try:
+                # nothing is sent until the client asks for a WATCH
+                if b'?WATCH' not in client.recv(4096):
+                    return
+                self.clients.append(client)
+                while self._running:
+                    report = json.dumps(self.fixes(time.time())).encode() + b'\n'
+                    client.sendall(report)
+                    self.reports_sent += 1
+                    time.sleep(1 / self.rate_hz)
+            except OSError:
+                pass
+            finally:
+                if client in self.clients:
+                    self.clients.remove(client)
+
+    def start(self):
+        self._running = True
+        threading.Thread(target=self._accept, name='fakegpsd', daemon=True).start()
+
+    def stop(self):
+        self._running = False
+        self.server.close()
+        for client in list(self.clients):
+            try:
+                client.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+def main():
+    parser = argparse.ArgumentParser(
+                    prog = 'fakegpsd',
+                    description = 'Fake gpsd serving a car lapping a circle')
+
+    parser.add_argument('--host', default=gpsreader.default_host)
+    parser.add_argument('--port', type=int, default=gpsreader.default_port)
+    parser.add_argument('--lat', type=float, default=37.9)
+    parser.add_argument('--lon', type=float, default=-122.3)
+    parser.add_argument('--radius', type=float, default=200., help='circle radius in meters')
+    parser.add_argument('--lap', type=float, default=60., help='seconds per lap')
+    parser.add_argument('--rate', type=float, default=10., help='reports per second')
+
+    args = parser.parse_args()
+
+    server = FakeGpsd(circle_track(args.lat, args.lon, args.radius, args.lap), args.host, args.port, args.rate)
+    server.start()
+    print(f'Serving on {server.host}:{server.port}')
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
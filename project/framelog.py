@@ -0,0 +1,238 @@
+import collections, os, struct, threading, time, zlib
+import numpy as np
+
+import candump
+
+# Full rate raw CAN frame recording.
+#
+#   magic             8 bytes, b'CANFRAM1'
+#   chunks            chunk header followed by a zlib compressed payload
+#   index             one entry per chunk, written on close
+#   footer            index offset, b'CANFEND1'
+#
+# A chunk payload holds the columns of up to chunk_frames frames back to
+# back (float64 bus timestamps, uint32 IDs, uint8 DLCs, (N, 8) uint8 data),
+# which compresses much better than whole records. Chunk headers carry the
+# frame count and time range, so a file without index (recorder killed)
+# is still read by walking the headers.
+#
+# FrameRecorder.record only appends to a deque; packing, compression and
+# writing happen in a writer thread.
+
+magic = b'CANFRAM1'
+end_magic = b'CANFEND1'
+
+chunk_header = struct.Struct('<4sIIdd')
+index_entry = struct.Struct('<QIdd')
+footer = struct.Struct('<Q8s')
+
+ChunkInfo = collections.namedtuple('ChunkInfo', ['offset', 'count', 't_first', 't_last'])
+
+
+def pack_chunk(frames):
+    payload = b''.join([frames.timestamp.astype('<f8').tobytes(), frames.id.astype('<u4').tobytes(),
+        frames.dlc.astype(np.uint8).tobytes(), np.ascontiguousarray(frames.data, dtype=np.uint8).tobytes()])
+    payload = zlib.compress(payload, 1)
+    n = len(frames.timestamp)
+    # frames of several buses are not necessarily in time order
+    return chunk_header.pack(b'CHNK', len(payload), n, frames.timestamp.min(), frames.timestamp.max()) + payload
+
+
+def unpack_chunk(buf, count):
+    payload = zlib.decompress(buf)
+    timestamp = np.frombuffer(payload, dtype='<f8', count=count)
+    canid = np.frombuffer(payload, dtype='<u4', count=count, offset=count * 8)
+    dlc = np.frombuffer(payload, dtype=np.uint8, count=count, offset=count * 12)
+    data = np.frombuffer(payload, dtype=np.uint8, count=count * 8, offset=count * 13).reshape(count, 8)
+    return candump.Frames(timestamp, canid, dlc, data)
+
+
+class FrameRecorder():
+
+    def __init__(self, filename, chunk_frames=8192, max_chunk_age=1.0, poll_interval=0.05):
+        self._open(filename)
+
+        self.chunk_frames = chunk_frames
+        # a quiet bus still gets its frames on disk after this many seconds
+        self.max_chunk_age = max_chunk_age
+        self.poll_interval = poll_interval
+        self.frames_recorded = 0
+
+        # frames as (timestamp, id, data) tuples, or whole Frames batches
+        self._queue = collections.deque()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='framelog', daemon=True)
+        self._thread.start()
+
+    def _open(self, filename):
+        if os.path.exists(filename):
+            raise Exception(f'Recording already exists: {filename}')
+        self.file = open(filename, 'wb')
+        self.file.write(magic)
+        self.index = []
+
+    def _finish(self):
+        # write the index and close the file
+        index_offset = self.file.tell()
+        self.file.write(struct.pack('<4sI', b'INDX', len(self.index)))
+        self.file.write(b''.join(index_entry.pack(*c) for c in self.index))
+        self.file.write(footer.pack(index_offset, end_magic))
+        self.file.close()
+
+    def record(self, canid, data, timestamp):
+        # called from the CAN thread for every frame
+        self._queue.append((timestamp, canid, data))
+
+    def record_batch(self, frames):
+        # columnar Frames from the bulk receiver
+        self._queue.append(frames)
+
+    def _take(self):
+        # everything queued so far as one Frames
+        batches = []
+        tuples = []
+        for _ in range(len(self._queue)):
+            item = self._queue.popleft()
+            if isinstance(item, candump.Frames):
+                if tuples:
+                    batches.append(self._from_tuples(tuples))
+                    tuples = []
+                batches.append(item)
+            else:
+                tuples.append(item)
+        if tuples:
+            batches.append(self._from_tuples(tuples))
+        return candump.concatenate_frames(batches)
+
+    @staticmethod
+    def _from_tuples(tuples):
+        n = len(tuples)
+        timestamp = np.fromiter((t[0] for t in tuples), dtype=np.float64, count=n)
+        canid = np.fromiter((t[1] for t in tuples), dtype=np.uint32, count=n)
+        dlc = np.fromiter((len(t[2]) for t in tuples), dtype=np.uint8, count=n)
+        data = np.frombuffer(b''.join([bytes(t[2]).ljust(8, b'\0')[:8] for t in tuples]), dtype=np.uint8)
+        return candump.Frames(timestamp, canid, dlc, data.reshape(n, 8))
+
+    def _write_chunks(self, frames):
+        for start in range(0, len(frames.timestamp), self.chunk_frames):
+            chunk = candump.Frames(*(col[start:start + self.chunk_frames] for col in frames))
+            offset = self.file.tell()
+            self.file.write(pack_chunk(chunk))
+            self.index.append(ChunkInfo(offset, len(chunk.timestamp), chunk.timestamp.min(), chunk.timestamp.max()))
+            self.frames_recorded += len(chunk.timestamp)
+
+    def _run(self):
+        pending = []
+        pending_frames = 0
+        chunk_started = time.monotonic()
+        while True:
+            running = self._running
+            frames = self._take()
+            if len(frames.timestamp):
+                if not pending:
+                    chunk_started = time.monotonic()
+                pending.append(frames)
+                pending_frames += len(frames.timestamp)
+
+            if pending and (not running or pending_frames >= self.chunk_frames
+                    or time.monotonic() - chunk_started >= self.max_chunk_age):
+                self._write_chunks(candump.concatenate_frames(pending))
+                self.file.flush()
+                pending = []
+                pending_frames = 0
+
+            if not running:
+                return
+            time.sleep(self.poll_interval)
+
+    def close(self):
+        # write out what is queued, then the index
+        if not self._running:
+            return
+        self._running = False
+        self._thread.join()
+        self._finish()
+
+
+def is_frame_log(filename):
+    with open(filename, 'rb') as file:
+        return file.read(len(magic)) == magic
+
+
+def _scan_chunks(file, size):
+    index = []
+    offset = len(magic)
+    while offset + chunk_header.size <= size:
+        file.seek(offset)
+        tag, length, count, t_first, t_last = chunk_header.unpack(file.read(chunk_header.size))
+        if tag != b'CHNK' or offset + chunk_header.size + length > size:
+            break
+        index.append(ChunkInfo(offset, count, t_first, t_last))
+        offset += chunk_header.size + length
+    return index
+
+
+def read_index(filename):
+    # list of ChunkInfo, from the index if the recording was closed cleanly
+    with open(filename, 'rb') as file:
+        if file.read(len(magic)) != magic:
+            raise ValueError(f'Not a frame recording: {filename}')
+        size = os.path.getsize(filename)
+        if size >= len(magic) + footer.size:
+            file.seek(size - footer.size)
+            index_offset, tag = footer.unpack(file.read(footer.size))
+            if tag == end_magic:
+                file.seek(index_offset)
+                _, n = struct.unpack('<4sI', file.read(8))
+                entries = file.read(n * index_entry.size)
+                return [ChunkInfo(*e) for e in index_entry.iter_unpack(entries)]
+        return _scan_chunks(file, size)
+
+
+def iter_chunks(filename, start=0, stop=None, t_start=None, t_stop=None):
+    # yields Frames per recorded chunk whose header lies in the byte range
+    # [start, stop) and that overlaps the time range, if given
+    with open(filename, 'rb') as file:
+        for chunk in read_index(filename):
+            if chunk.offset < start or (stop is not None and chunk.offset >= stop):
+                continue
+            if (t_start is not None and chunk.t_last < t_start) or (t_stop is not None and chunk.t_first > t_stop):
+                continue
+            file.seek(chunk.offset)
+            _, length, count, _, _ = chunk_header.unpack(file.read(chunk_header.size))
+            frames = unpack_chunk(file.read(length), count)
+            if t_start is not None or t_stop is not None:
+                mask = np.ones(count, dtype=bool)
+                if t_start is not None:
+                    mask &= frames.timestamp >= t_start
+                if t_stop is not None:
+                    mask &= frames.timestamp < t_stop
+                frames = candump.Frames(*(col[mask] for col in frames))
+            yield frames
+
+
+def read_frames(filename, t_start=None, t_stop=None):
+    return candump.concatenate_frames(iter_chunks(filename, t_start=t_start, t_stop=t_stop))
+
+
+# entry points for the offline tools, taking either candump logs or recordings
+
+def iter_log(filename, chunk_size=candump.default_chunk_size, start=0, stop=None):
+    if is_frame_log(filename):
+        return iter_chunks(filename, start, stop)
+    return candump.iter_chunks(filename, chunk_size, start, stop)
+
+
+def read_log(filename, start=0, stop=None):
+    return candump.concatenate_frames(iter_log(filename, start=start, stop=stop))
+
+
+def split_log(filename, n):
+    # n byte ranges covering the file, at chunk or line boundaries
+    if not is_frame_log(filename):
+        return candump.split_ranges(filename, n)
+    offsets = [c.offset for c in read_index(filename)]
+    if not offsets:
+        return []
+    bounds = sorted({offsets[len(offsets) * i // n] for i in range(n)}) + [os.path.getsize(filename)]
+    return list(zip(bounds[:-1], bounds[1:]))
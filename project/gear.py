@@ -0,0 +1,109 @@
+import bisect
+import numpy as np
+
+# Gear detection from the rpm / speed ratio.
+#
+# Each gear's ratio band (ratio * (1 -+ tolerance)) is merged into one sorted
+# table of band edges once, with the gear of every interval between two
+# edges (the lowest gear where bands overlap), so a lookup is one bisection
+# instead of a division per gear.
+#
+# A detected gear is only reported after the ratio stayed in its band, with
+# the clutch out and not in neutral, for stable_time seconds of bus time.
+# GearDetector.update() runs once per 0x201/0x231 frame (per display or log
+# refresh with lazy decoding); detect() is the same
+# state machine vectorized over whole traces, with 0 for neutral.
+
+# reference gear ratios, rpm / vss, in kph
+ref_gear_ratios = [142.91697013838305, 83.27517447657029, 59.904354392147, 42.876771767428416, 36.34426533259218, 30.183701387531755]
+
+inputs = ('rpm', 'speed', 'clutch', 'gearneutral')
+
+neutral = 'n'
+
+
+def ratio_table(ratios, tolerance=0.1):
+    # (edges, gears): the ratio x is in gear gears[bisect_right(edges, x)],
+    # None outside every band
+    bands = [(r * (1 - tolerance), r * (1 + tolerance)) for r in ratios]
+    edges = sorted({edge for band in bands for edge in band})
+    gears = [None] * (len(edges) + 1)
+    for k in range(1, len(edges)):
+        middle = (edges[k - 1] + edges[k]) / 2
+        for i, (low, high) in enumerate(bands):
+            if low < middle < high:
+                gears[k] = i + 1
+                break
+    return edges, gears
+
+
+class GearDetector():
+
+    def __init__(self, ratios, tolerance=0.1, stable_time=0.1, min_speed=1.):
+        # ratios: rpm / speed of each gear, first gear first
+        self.ratios = list(ratios)
+        self.edges, self.band_gears = ratio_table(self.ratios, tolerance)
+        self.stable_time = stable_time
+        # below this speed the ratio is meaningless
+        self.min_speed = min_speed
+
+        # latest result, replaced as a whole so readers need no lock
+        self.gear = neutral
+        self.timestamp = 0.
+        self.evaluations = 0
+        self._last_unstable = 0.
+
+    def lookup(self, rpm, speed):
+        # gear whose band the ratio falls in, or None
+        if speed < self.min_speed:
+            return None
+        return self.band_gears[bisect.bisect_right(self.edges, rpm / speed)]
+
+    def update(self, t, rpm, speed, clutch, gearneutral):
+        # t: bus timestamp of the frame that changed an input
+        candidate = None if clutch or gearneutral else self.lookup(rpm, speed)
+        if candidate is None:
+            self._last_unstable = t
+            gear = neutral
+        elif t - self._last_unstable > self.stable_time:
+            gear = candidate
+        else:
+            gear = neutral
+        self.gear = gear
+        self.timestamp = t
+        self.evaluations += 1
+        return gear
+
+    def detect(self, t, rpm, speed, clutch, gearneutral):
+        # gear at every timestamp of input arrays sampled at the same times
+        t = np.asarray(t, dtype=np.float64)
+        rpm = np.asarray(rpm, dtype=np.float64)
+        speed = np.asarray(speed, dtype=np.float64)
+        gears = np.array([g or 0 for g in self.band_gears], dtype=np.int8)
+
+        moving = speed >= self.min_speed
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = rpm / np.where(moving, speed, 1.)
+        candidate = gears[np.searchsorted(self.edges, ratio, side='right')]
+        candidate[~moving | np.asarray(clutch, dtype=bool) | np.asarray(gearneutral, dtype=bool)] = 0
+
+        last_unstable = np.maximum.accumulate(np.where(candidate == 0, t, 0.))
+        return np.where(t - last_unstable > self.stable_time, candidate, 0)
+
+    def detect_traces(self, traces):
+        # (timestamps, gears) from {field: (timestamp, values)} traces, one
+        # evaluation per frame of any input like the live version
+        t, *values = merge_inputs(traces)
+        return t, self.detect(t, *values)
+
+
+def merge_inputs(traces, fields=inputs):
+    # inputs on the union of their timestamps, each holding its last value;
+    # 0 before its first frame, as in a fresh SignalStore
+    t = np.unique(np.concatenate([np.asarray(traces[f][0], dtype=np.float64) for f in fields]))
+    merged = [t]
+    for f in fields:
+        ft, fv = np.asarray(traces[f][0]), np.asarray(traces[f][1], dtype=np.float64)
+        i = np.searchsorted(ft, t, side='right') - 1
+        merged.append(np.where(i >= 0, fv[np.maximum(i, 0)], 0.) if len(ft) else np.zeros(len(t)))
+    return merged
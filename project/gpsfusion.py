@@ -0,0 +1,197 @@
+import bisect, math
+import numpy as np
+
+# GPS/CAN fusion: positions at CAN timestamps.
+#
+# GPS fixes arrive at 1-10 Hz, CAN at hundreds of Hz. Between two fixes the
+# car is placed on the straight line between them, not in proportion to
+# time but to the distance driven according to the wheel speed (0x201
+# speed), which follows braking and acceleration within the fix interval.
+# After the last fix the position is dead reckoned along the last heading
+# for up to max_extrapolation seconds.
+#
+# GPS fix times and CAN bus timestamps are both taken as UTC epoch seconds,
+# i.e. the system clock is assumed to be disciplined by gpsd (chrony/ntp).
+#
+# Positions are computed in a local flat frame in meters around the first
+# fix (equirectangular, fine at track scale) and returned as lat/lon.
+#
+# GpsCanFusion is the live version with a short history, fuse() the
+# vectorized one for whole traces.
+
+earth_radius = 6371000.
+kph = 1 / 3.6
+
+
+class LocalFrame():
+
+    def __init__(self, lat, lon):
+        self.lat = lat
+        self.lon = lon
+        self.kx = math.radians(1) * earth_radius * math.cos(math.radians(lat))
+        self.ky = math.radians(1) * earth_radius
+
+    def to_xy(self, lat, lon):
+        return (lon - self.lon) * self.kx, (lat - self.lat) * self.ky
+
+    def to_latlon(self, x, y):
+        return self.lat + y / self.ky, self.lon + x / self.kx
+
+
+def odometer(speed_t, speed_kph):
+    # cumulative distance in meters at each speed sample, trapezoidal
+    speed_t = np.asarray(speed_t, dtype=np.float64)
+    v = np.asarray(speed_kph, dtype=np.float64) * kph
+    d = np.zeros(len(v))
+    if len(v) > 1:
+        d[1:] = np.cumsum(np.diff(speed_t) * (v[1:] + v[:-1]) / 2)
+    return d
+
+
+def fuse(t, gps_t, gps_lat, gps_lon, speed_t, speed_kph, max_extrapolation=1.0, min_distance=0.5):
+    # lat, lon arrays at the timestamps t; NaN outside the fixes, except up
+    # to max_extrapolation seconds after the last one
+    t = np.asarray(t, dtype=np.float64)
+    gps_t = np.asarray(gps_t, dtype=np.float64)
+    if not len(gps_t):
+        return np.full(len(t), np.nan), np.full(len(t), np.nan)
+
+    frame = LocalFrame(float(gps_lat[0]), float(gps_lon[0]))
+    x, y = frame.to_xy(np.asarray(gps_lat, dtype=np.float64), np.asarray(gps_lon, dtype=np.float64))
+    dist = odometer(speed_t, speed_kph)
+    if len(dist):
+        d_fix = np.interp(gps_t, speed_t, dist)
+        d_t = np.interp(t, speed_t, dist)
+    else:
+        d_fix = np.zeros(len(gps_t))
+        d_t = np.zeros(len(t))
+
+    # interval of each timestamp, the last interval also covers extrapolation
+    i = np.clip(np.searchsorted(gps_t, t, side='right') - 1, 0, max(len(gps_t) - 2, 0))
+    j = np.minimum(i + 1, len(gps_t) - 1)
+    span_d = d_fix[j] - d_fix[i]
+    span_t = gps_t[j] - gps_t[i]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        by_distance = (d_t - d_fix[i]) / span_d
+        by_time = (t - gps_t[i]) / span_t
+    # barely moving per the wheels: fall back to time
+    frac = np.where(span_d > min_distance, by_distance, by_time)
+    frac = np.where(span_t > 0, frac, 0.)
+
+    dx, dy = x[j] - x[i], y[j] - y[i]
+    px = x[i] + frac * dx
+    py = y[i] + frac * dy
+
+    # beyond the last fix: continue along the last heading by wheel distance
+    after = t > gps_t[-1]
+    if np.any(after):
+        length = np.hypot(dx[after], dy[after])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ux = np.where(length > 0, dx[after] / length, 0.)
+            uy = np.where(length > 0, dy[after] / length, 0.)
+        extra = d_t[after] - d_fix[-1]
+        px[after] = x[-1] + ux * extra
+        py[after] = y[-1] + uy * extra
+
+    valid = (t >= gps_t[0]) & (t <= gps_t[-1] + max_extrapolation)
+    lat, lon = frame.to_latlon(px, py)
+    return np.where(valid, lat, np.nan), np.where(valid, lon, np.nan)
+
+
+def fuse_log(rows, max_extrapolation=1.0):
+    # lat, lon at every DataLogger row (binlog.read_log or Session.rows);
+    # fixes are the rows where gps_updated is set
+    fixes = rows[rows['gps_updated'] == 1]
+    return fuse(rows['time'], fixes['gpstime'], fixes['lat'], fixes['long'], rows['time'], rows['speed'],
+        max_extrapolation)
+
+
+class GpsCanFusion():
+    # live version; keeps history seconds of fixes and wheel speed
+
+    def __init__(self, history=5.0, max_extrapolation=1.0, min_distance=0.5):
+        self.history = history
+        self.max_extrapolation = max_extrapolation
+        self.min_distance = min_distance
+        self.frame = None
+
+        self.fix_t = []
+        self.fix_xy = []
+        self.fix_d = []
+
+        # odometer samples
+        self.speed_t = []
+        self.dist = []
+        self._last_speed = None
+
+    def _trim(self, times, *lists):
+        # drop samples older than history, in bulk
+        if times and times[-1] - times[0] > 2 * self.history:
+            n = bisect.bisect_left(times, times[-1] - self.history)
+            for l in (times,) + lists:
+                del l[:n]
+
+    def add_speed(self, t, speed_kph):
+        v = speed_kph * kph
+        if self._last_speed is None:
+            d = 0.
+        else:
+            t0, v0 = self._last_speed
+            if t <= t0:
+                return
+            d = self.dist[-1] + (t - t0) * (v + v0) / 2
+        self._last_speed = (t, v)
+        self.speed_t.append(t)
+        self.dist.append(d)
+        self._trim(self.speed_t, self.dist)
+
+    def distance_at(self, t):
+        # odometer reading at t, extrapolated with the last speed
+        if not self.speed_t:
+            return 0.
+        i = bisect.bisect_right(self.speed_t, t)
+        if i == len(self.speed_t):
+            t0, v0 = self._last_speed
+            return self.dist[-1] + (t - t0) * v0
+        if i == 0:
+            return self.dist[0]
+        t0, t1 = self.speed_t[i - 1], self.speed_t[i]
+        d0, d1 = self.dist[i - 1], self.dist[i]
+        return d0 + (d1 - d0) * (t - t0) / (t1 - t0)
+
+    def add_fix(self, t, lat, lon):
+        if self.frame is None:
+            self.frame = LocalFrame(lat, lon)
+        if self.fix_t and t <= self.fix_t[-1]:
+            return
+        self.fix_t.append(t)
+        self.fix_xy.append(self.frame.to_xy(lat, lon))
+        self.fix_d.append(self.distance_at(t))
+        self._trim(self.fix_t, self.fix_xy, self.fix_d)
+
+    def position(self, t):
+        # (lat, lon) at t, None outside the covered time
+        n = len(self.fix_t)
+        if not n or t < self.fix_t[0] or t > self.fix_t[-1] + self.max_extrapolation:
+            return None
+        if n == 1:
+            return self.frame.to_latlon(*self.fix_xy[0])
+
+        i = min(max(bisect.bisect_right(self.fix_t, t) - 1, 0), n - 2)
+        (x0, y0), (x1, y1) = self.fix_xy[i], self.fix_xy[i + 1]
+        dx, dy = x1 - x0, y1 - y0
+        d = self.distance_at(t)
+
+        if t > self.fix_t[-1]:
+            length = math.hypot(dx, dy)
+            extra = d - self.fix_d[-1]
+            if not length:
+                return self.frame.to_latlon(x1, y1)
+            return self.frame.to_latlon(x1 + dx / length * extra, y1 + dy / length * extra)
+
+        span_d = self.fix_d[i + 1] - self.fix_d[i]
+        if span_d > self.min_distance:
+            frac = (d - self.fix_d[i]) / span_d
+        else:
+            frac = (t - self.fix_t[i]) / (self.fix_t[i + 1] - self.fix_t[i])
+        return self.frame.to_latlon(x0 + frac * dx, y0 + frac * dy)
@@ -0,0 +1,125 @@
+from collections import namedtuple
+import datetime, json, logging, socket, threading, time
+
+# Background gpsd client.
+#
+# A thread keeps a WATCH connection to gpsd open, parses the JSON stream and
+# publishes every TPV report as a GpsFix into a single attribute. Readers
+# (display, logger) only fetch that attribute, so they never wait on gpsd;
+# replacing it is atomic, so no lock is needed. The connection is retried
+# forever, e.g. while gpsd is still starting up.
+
+default_host = '127.0.0.1'
+default_port = 2947
+
+watch_command = b'?WATCH={"enable":true,"json":true}\n'
+
+
+class GpsFix(namedtuple('GpsFix', ['mode', 'time', 'lat', 'lon', 'speed', 'track', 'received'])):
+    # same accessors as the gpsd2 responses used before
+
+    def get_time(self):
+        return self.time
+
+    def position(self):
+        return self.lat, self.lon
+
+
+def parse_time(s):
+    # gpsd sends ISO 8601 UTC, e.g. 2023-04-01T12:00:00.000Z
+    return datetime.datetime.fromisoformat(s.replace('Z', '+00:00'))
+
+
+def parse_report(line, received):
+    # GpsFix for a TPV report, None for anything else
+    try:
+        report = json.loads(line)
+    except ValueError:
+        return None
+    if report.get('class') != 'TPV':
+        return None
+    mode = report.get('mode', 0)
+    if mode < 2 or 'time' not in report:
+        return GpsFix(mode, None, None, None, None, None, received)
+    return GpsFix(mode, parse_time(report['time']), report.get('lat'), report.get('lon'),
+        report.get('speed'), report.get('track'), received)
+
+
+class GPSReader():
+
+    def __init__(self, host=default_host, port=default_port, reconnect_delay=1.0, max_age=2.0):
+        self.host = host
+        self.port = port
+        self.reconnect_delay = reconnect_delay
+        # fixes older than this (monotonic seconds) are not served
+        self.max_age = max_age
+
+        self.fix = None
+        self.fixes_received = 0
+        self.connects = 0
+        # called from the reader thread with every new GpsFix
+        self.on_fix = None
+
+        self._sock = None
+        self._running = False
+        self._thread = None
+
+    def latest(self):
+        fix = self.fix
+        if fix is None or time.monotonic() - fix.received > self.max_age:
+            return None
+        return fix
+
+    def _read(self, sock):
+        sock.sendall(watch_command)
+        buf = b''
+        while self._running:
+            data = sock.recv(4096)
+            if not data:
+                return
+            buf += data
+            *lines, buf = buf.split(b'\n')
+            for line in lines:
+                fix = parse_report(line, time.monotonic())
+                if fix is None:
+                    continue
+                self.fix = fix
+                self.fixes_received += 1
+                if self.on_fix:
+                    self.on_fix(fix)
+
+    def _run(self):
+        # warn once per outage, not on every retry
+        warned = False
+        while self._running:
+            try:
+                with socket.create_connection((self.host, self.port), timeout=5) as sock:
+                    sock.settimeout(None)
+                    self._sock = sock
+                    self.connects += 1
+                    warned = False
+                    self._read(sock)
+            except OSError as e:
+                if self._running and not warned:
+                    logging.warning(f'gpsd connection failed: {e}')
+                    warned = True
+            finally:
+                self._sock = None
+            if self._running:
+                time.sleep(self.reconnect_delay)
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='gpsreader', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        sock = self._sock
+        if sock:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        if self._thread:
+            self._thread.join()
@@ -0,0 +1,117 @@
+import bisect, math, time
+from PyQt5 import QtCore, QtWidgets
+
+# Latency instrumentation for the live dashboard.
+#
+# Stages, all measured against the bus timestamp of the frame:
+#   decode   frame decoded in the CAN listener, or when read in lazy mode
+#   store    frame written to the signal store
+#   paint    frame's values handed to the widgets by update_displays
+# plus the display timer jitter and the duration of update_displays.
+# Samples go into fixed size log spaced histograms, so recording costs a
+# bisect and an increment regardless of how long the dashboard runs.
+#
+# Samples are recorded per frame ID. Every signal of a frame has the frame's
+# timestamp and is decoded, stored and painted together with the others, so
+# the histogram of an ID is the histogram of each of its signals; the report
+# lists it per signal.
+
+
+class LatencyHistogram():
+
+    def __init__(self, low=1e-5, high=10., bins_per_decade=20):
+        decades = math.log10(high / low)
+        n = int(round(decades * bins_per_decade))
+        self.edges = [low * 10 ** (i / bins_per_decade) for i in range(n + 1)]
+        # counts[0] is below low, counts[-1] above high
+        self.counts = [0] * (n + 2)
+        self.count = 0
+        self.total = 0.
+        self.max = 0.
+
+    def add(self, seconds):
+        self.counts[bisect.bisect_right(self.edges, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, p):
+        # upper edge of the bin holding the p-th percentile, capped at max
+        if not self.count:
+            return math.nan
+        target = self.count * p / 100.
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= target:
+                return min(self.edges[min(i, len(self.edges) - 1)], self.max)
+        return self.max
+
+    def summary(self):
+        if not self.count:
+            return 'no samples'
+        return (f'n={self.count} mean={self.total / self.count * 1e3:.2f}ms p50={self.percentile(50) * 1e3:.2f}ms '
+            f'p99={self.percentile(99) * 1e3:.2f}ms max={self.max * 1e3:.2f}ms')
+
+
+class Instrumentation():
+
+    def __init__(self, display_interval=0.016, signals={}):
+        # signals: {key: signal names} of the frames recorded under key
+        self.signals = dict(signals)
+        self._signal_keys = {name: key for key, names in self.signals.items() for name in names}
+        self.histograms = {}
+        self.display_interval = display_interval
+        self._last_tick = None
+
+    def histogram(self, stage, key=''):
+        h = self.histograms.get((stage, key))
+        if h is None:
+            h = self.histograms[(stage, key)] = LatencyHistogram()
+        return h
+
+    def signal_histogram(self, stage, signal):
+        return self.histogram(stage, self._signal_keys[signal])
+
+    def record(self, stage, key, frame_timestamp):
+        # latency from the frame's bus timestamp to now
+        self.histogram(stage, key).add(max(time.time() - frame_timestamp, 0.))
+
+    def display_started(self):
+        now = time.perf_counter()
+        if self._last_tick is not None:
+            jitter = abs(now - self._last_tick - self.display_interval)
+            self.histogram('display jitter').add(jitter)
+        self._last_tick = now
+        return now
+
+    def display_finished(self, started):
+        self.histogram('update_displays').add(time.perf_counter() - started)
+
+    def report(self):
+        lines = [(stage, name, h) for (stage, key), h in self.histograms.items()
+            for name in self.signals.get(key) or [key]]
+        return '\n'.join(f'{stage} {name}'.strip() + f': {h.summary()}'
+            for stage, name, h in sorted(lines, key=lambda l: l[:2]))
+
+
+class LatencyOverlay(QtWidgets.QLabel):
+    # small translucent debug overlay refreshed once a second
+
+    def __init__(self, parent, instrumentation):
+        super(LatencyOverlay, self).__init__(parent)
+        self.instrumentation = instrumentation
+        self.setStyleSheet('background-color: rgba(0, 0, 0, 180); color: white; font: 9pt monospace;')
+        self.setAttribute(QtCore.Qt.WA_TransparentForMouseEvents)
+        self.move(4, 4)
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.setInterval(1000)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start()
+
+    def refresh(self):
+        self.setText(self.instrumentation.report())
+        self.adjustSize()
+        self.raise_()
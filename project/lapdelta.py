@@ -0,0 +1,131 @@
+import argparse, bisect
+import numpy as np
+
+import gpsfusion, laptiming
+
+# Live delta against a reference lap.
+#
+# The reference lap is stored as two increasing arrays: distance driven
+# since the start/finish line (wheel speed odometer, the same one the live
+# side uses, so both sides share the tire's scale) and elapsed time at that
+# distance. Distance only grows during a lap, so the live side keeps a
+# cursor into the arrays and advances it by the few samples covered since
+# the last update instead of searching the whole lap.
+
+
+class ReferenceLap():
+
+    def __init__(self, distance, time):
+        distance = np.asarray(distance, dtype=np.float64)
+        time = np.asarray(time, dtype=np.float64)
+        # standing still adds samples without distance, keep the first
+        keep = np.concatenate([[True], np.diff(distance) > 0])
+        self.distance = distance[keep].tolist()
+        self.time = time[keep].tolist()
+        self.lap_time = float(time[-1]) if len(time) else None
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as f:
+            return cls(f['distance'], f['time'])
+
+    def save(self, filename):
+        np.savez(filename, distance=np.array(self.distance), time=np.array(self.time))
+
+    def time_at(self, distance):
+        # searching version, for checks and offline use
+        d = self.distance
+        i = min(max(bisect.bisect_right(d, distance) - 1, 0), len(d) - 2)
+        return self.time[i] + (self.time[i + 1] - self.time[i]) * (distance - d[i]) / (d[i + 1] - d[i])
+
+
+def reference_from_log(rows, segments, lap=None):
+    # ReferenceLap of one lap (default the best) of DataLogger rows
+    lat, lon = gpsfusion.fuse_log(rows)
+    timer = laptiming.replay(laptiming.LapTimer(segments), rows['time'], lat, lon)
+    if not timer.laps:
+        raise ValueError('No complete lap in the log')
+    if lap is None:
+        lap = min(range(len(timer.laps)), key=lambda i: timer.laps[i][0])
+    end = timer.lap_ends[lap]
+    start = end - timer.laps[lap][0]
+
+    odometer = gpsfusion.odometer(rows['time'], rows['speed'])
+    t = rows['time']
+    inside = (t > start) & (t < end)
+    times = np.concatenate([[start], t[inside], [end]])
+    distance = np.interp(times, t, odometer)
+    return ReferenceLap(distance - distance[0], times - start)
+
+
+class DeltaCursor():
+
+    def __init__(self, reference):
+        self.reference = reference
+        self.reset()
+
+    def reset(self):
+        # call at the start/finish line
+        self.i = 0
+
+    def delta(self, distance, elapsed):
+        # seconds behind (positive) or ahead (negative) of the reference
+        d = self.reference.distance
+        t = self.reference.time
+        n = len(d)
+        if n < 2:
+            return None
+        i = self.i
+        while i < n - 2 and d[i + 1] <= distance:
+            i += 1
+        while i > 0 and d[i] > distance:
+            i -= 1
+        self.i = i
+        if distance > d[-1]:
+            # past the reference's line, e.g. a longer line through a corner
+            return elapsed - t[-1]
+        ref = t[i] + (t[i + 1] - t[i]) * (distance - d[i]) / (d[i + 1] - d[i])
+        return elapsed - ref
+
+
+def main():
+    parser = argparse.ArgumentParser(
+                    prog = 'lapdelta',
+                    description = 'Build a reference lap from a DataLogger log, optionally comparing another log against it')
+
+    parser.add_argument('log', type=str, help='DataLogger log (CSV or binary) or session directory')
+    parser.add_argument('-s', '--segments', required=True, help='Track sector segments')
+    parser.add_argument('--lap', type=int, help='Lap number to use, default the best')
+    parser.add_argument('-o', '--output', help='Reference lap file to write (.npz)')
+    parser.add_argument('--compare', help='Log whose laps are replayed against the reference')
+
+    args = parser.parse_args()
+
+    segments = laptiming.load_gates(args.segments)
+    reference = reference_from_log(laptiming.read_rows(args.log), segments, None if args.lap is None else args.lap - 1)
+    print(f'reference lap {laptiming.format_time(reference.lap_time)}, {reference.distance[-1]:.0f} m')
+    if args.output:
+        reference.save(args.output)
+
+    if args.compare:
+        rows = laptiming.read_rows(args.compare)
+        lat, lon = gpsfusion.fuse_log(rows)
+        timer = laptiming.replay(laptiming.LapTimer(segments), rows['time'], lat, lon)
+        odometer = gpsfusion.odometer(rows['time'], rows['speed'])
+        cursor = DeltaCursor(reference)
+        for n, end in enumerate(timer.lap_ends):
+            start = end - timer.laps[n][0]
+            inside = (rows['time'] >= start) & (rows['time'] < end)
+            if not inside.any():
+                print(f'lap {n + 1}: {laptiming.format_time(timer.laps[n][0])}  no logged rows')
+                continue
+            cursor.reset()
+            d0 = np.interp(start, rows['time'], odometer)
+            deltas = [cursor.delta(d - d0, t - start) for t, d in zip(rows['time'][inside].tolist(),
+                odometer[inside].tolist())]
+            print(f'lap {n + 1}: {laptiming.format_time(timer.laps[n][0])}  '
+                f'delta at finish {deltas[-1]:+.2f} s, range {min(deltas):+.2f} to {max(deltas):+.2f} s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+import argparse, math, os
+import numpy as np
+
+import binlog, gpsfusion, segmentlog
+
+# Lap, sector and microsegment timing from GPS positions.
+#
+# Track definitions are text files with one timing line (gate) per line,
+# two points across the track as lat1,lon1,lat2,lon2; '#' starts a comment.
+# In the --segments file the first gate is start/finish and the following
+# ones end sectors 1, 2, ... in driving order. --microsegments gates are
+# finer split points used for the predicted lap time.
+#
+# Each position update is a short movement from the previous position. The
+# gates are bucketed into a uniform grid once, so finding the gates a
+# movement may cross only looks at the few cells it touches instead of every
+# gate. The crossing time is interpolated along the movement.
+
+
+def load_gates(filename):
+    gates = []
+    with open(filename) as file:
+        for line in file:
+            line = line.split('#')[0].strip()
+            if not line:
+                continue
+            lat1, lon1, lat2, lon2 = (float(v) for v in line.split(','))
+            gates.append(((lat1, lon1), (lat2, lon2)))
+    return gates
+
+
+class GateGrid():
+
+    def __init__(self, gates_xy, cell_size=25., max_cells=64):
+        # gates_xy: list of ((x1, y1), (x2, y2)) in meters
+        self.gates = gates_xy
+        self.cell_size = cell_size
+        # movements touching more cells than this (GPS jumps) check all gates
+        self.max_cells = max_cells
+        self.cells = {}
+        for g, ((x1, y1), (x2, y2)) in enumerate(gates_xy):
+            for cell in self._cells(min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2)):
+                self.cells.setdefault(cell, []).append(g)
+
+    def _cells(self, x0, y0, x1, y1):
+        c = self.cell_size
+        return [(i, j) for i in range(math.floor(x0 / c), math.floor(x1 / c) + 1)
+            for j in range(math.floor(y0 / c), math.floor(y1 / c) + 1)]
+
+    def candidates(self, x0, y0, x1, y1):
+        c = self.cell_size
+        nx = math.floor(max(x0, x1) / c) - math.floor(min(x0, x1) / c) + 1
+        ny = math.floor(max(y0, y1) / c) - math.floor(min(y0, y1) / c) + 1
+        if nx * ny > self.max_cells:
+            return range(len(self.gates))
+        found = set()
+        for cell in self._cells(min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)):
+            found.update(self.cells.get(cell, ()))
+        return found
+
+    def crossings(self, x0, y0, x1, y1):
+        # [(fraction along the movement, gate)] in crossing order
+        dx, dy = x1 - x0, y1 - y0
+        result = []
+        for g in self.candidates(x0, y0, x1, y1):
+            (ax, ay), (bx, by) = self.gates[g]
+            ex, ey = bx - ax, by - ay
+            denom = dx * ey - dy * ex
+            if not denom:
+                continue
+            s = ((ax - x0) * ey - (ay - y0) * ex) / denom
+            u = ((ax - x0) * dy - (ay - y0) * dx) / denom
+            if 0 <= s <= 1 and 0 <= u <= 1:
+                result.append((s, g))
+        result.sort()
+        return result
+
+
+def format_time(seconds):
+    if seconds is None:
+        return 'X:XX.X'
+    minutes, seconds = divmod(round(seconds, 1), 60)
+    return f'{minutes:.0f}:{seconds:04.1f}'
+
+
+class LapTimer():
+
+    def __init__(self, segments, microsegments=(), min_gate_interval=2.0):
+        # segments and microsegments: gates as returned by load_gates
+        if not segments:
+            raise ValueError('The segments file needs at least a start/finish gate')
+        (lat, lon), _ = segments[0]
+        self.frame = gpsfusion.LocalFrame(float(lat), float(lon))
+        self.n_segments = len(segments)
+        gates = [tuple(self.frame.to_xy(float(lat), float(lon)) for lat, lon in gate)
+            for gate in list(segments) + list(microsegments)]
+        self.grid = GateGrid(gates)
+        # a gate crossed again within this many seconds is GPS jitter
+        self.min_gate_interval = min_gate_interval
+
+        self._last = None
+        self._last_crossed = {}
+
+        self.lap_start = None
+        self.sector_start = None
+        self.sector = 0
+        self.sector_times = []
+        self.splits = {}
+        self.last_split = None
+
+        self.laps = []
+        self.lap_ends = []
+        self.last_lap = None
+        self.best_lap = None
+        self.best_sectors = None
+        self.best_splits = {}
+
+    def _cross(self, t, gate):
+        last = self._last_crossed.get(gate)
+        if last is not None and t - last < self.min_gate_interval:
+            return
+        self._last_crossed[gate] = t
+
+        if gate == 0:
+            if self.lap_start is not None:
+                self._finish_lap(t)
+            self.lap_start = t
+            self.sector_start = t
+            self.sector = 0
+            self.sector_times = []
+            self.splits = {}
+            self.last_split = None
+        elif self.lap_start is None:
+            return
+        elif gate < self.n_segments:
+            # sectors only count in order
+            if gate == self.sector + 1:
+                self.sector_times.append(t - self.sector_start)
+                self.sector_start = t
+                self.sector = gate
+        else:
+            self.splits[gate] = t - self.lap_start
+            self.last_split = gate
+
+    def _finish_lap(self, t):
+        lap = t - self.lap_start
+        self.sector_times.append(t - self.sector_start)
+        self.laps.append((lap, self.sector_times))
+        self.lap_ends.append(t)
+        self.last_lap = lap
+        if self.best_lap is None or lap < self.best_lap:
+            self.best_lap = lap
+            self.best_sectors = self.sector_times
+            self.best_splits = self.splits
+
+    def update(self, t, lat, lon):
+        # feed one position; cost does not grow with the number of gates
+        x, y = self.frame.to_xy(lat, lon)
+        if self._last is not None:
+            t0, x0, y0 = self._last
+            for s, gate in self.grid.crossings(x0, y0, x, y):
+                self._cross(t0 + s * (t - t0), gate)
+        self._last = (t, x, y)
+
+    def elapsed(self, t):
+        return None if self.lap_start is None else t - self.lap_start
+
+    def sector_elapsed(self, t):
+        return None if self.sector_start is None else t - self.sector_start
+
+    def predicted(self):
+        # best lap corrected by the gap at the last common split point
+        if self.best_lap is None or self.lap_start is None:
+            return None
+        if self.last_split is not None and self.last_split in self.best_splits:
+            return self.best_lap + self.splits[self.last_split] - self.best_splits[self.last_split]
+        if self.sector and self.best_sectors and len(self.best_sectors) >= self.sector:
+            return self.best_lap + sum(self.sector_times) - sum(self.best_sectors[:self.sector])
+        return self.best_lap
+
+
+def replay(timer, t, lat, lon):
+    # run a recorded trace through a timer, skipping missing positions
+    for ti, la, lo in zip(np.asarray(t).tolist(), np.asarray(lat).tolist(), np.asarray(lon).tolist()):
+        if not (math.isnan(la) or math.isnan(lo)):
+            timer.update(ti, la, lo)
+    return timer
+
+
+def read_rows(path):
+    # DataLogger rows from a session directory, binary or CSV log
+    if os.path.isdir(path):
+        return segmentlog.Session(path).rows()
+    with open(path, 'rb') as file:
+        is_binary = file.read(len(binlog.magic)) == binlog.magic
+    return np.array(binlog.read_log(path)) if is_binary else binlog.read_csv(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+                    prog = 'laptiming',
+                    description = 'Lap and sector times of a recorded DataLogger log')
+
+    parser.add_argument('log', type=str, help='DataLogger log (CSV or binary) or session directory')
+    parser.add_argument('-s', '--segments', required=True, help='Track sector segments')
+    parser.add_argument('-m', '--microsegments', help='Track microsegments')
+
+    args = parser.parse_args()
+
+    rows = read_rows(args.log)
+    lat, lon = gpsfusion.fuse_log(rows)
+    timer = LapTimer(load_gates(args.segments), load_gates(args.microsegments) if args.microsegments else ())
+    replay(timer, rows['time'], lat, lon)
+
+    for i, (lap, sectors) in enumerate(timer.laps):
+        print(f'lap {i + 1}: {format_time(lap)}  ' + '  '.join(format_time(s) for s in sectors))
+    print(f'best: {format_time(timer.best_lap)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,11 @@
 import re
-import canmanager, candecoder
+import canmanager, canfilter, signalspec, signalstore, asyncmode, widgetbinding, tachwidget, instrumentation, binlog, framelog, segmentlog, gpsreader, gpsfusion, laptiming, lapdelta, gear, derived
 import pprint, logging, argparse
 from abc import ABC, abstractmethod
 
-import time, sys, os
+import time, sys, os, queue, threading
 import itertools
-
-import gpsd2
+import numpy as np
 
 from PyQt5 import QtWidgets
 from PyQt5.QtCore import QTimer
@@ -16,8 +15,8 @@ from ui import Ui_MainWindow
 
 
 
-revlimit2 = 6800
-
+state_label_down_style = 'font: 18pt "Targa MS"; color: red;'
+state_label_up_style = 'font: 18pt "Targa MS"; color: rgb(246, 245, 244);'
 
 
 class DataLoggableABC(ABC):
@@ -31,24 +30,68 @@ class DataLoggableABC(ABC):
     def get_log_data(self) -> list[str]:
         pass
 
+    @classmethod
+    def get_log_types(cls) -> dict[str, str]:
+        # binary log column types by label (see binlog), float64 if missing
+        return {}
+
 
 
 class DisplayManager(DataLoggableABC):
 
-    # reference gear ratios, rpm / vss, in kph
-    ref_gear_ratios = [142.91697013838305, 83.27517447657029, 59.904354392147, 42.876771767428416, 36.34426533259218, 30.183701387531755]
+    ref_gear_ratios = gear.ref_gear_ratios
     
     keys_to_log = ['rpm', 'speed', 'accpos', 'brake', 'clutch', 'ect', 'iat']
 
+    # binary log column types: flags in one byte, CAN values as float32
+    log_types = {'rpm': '<f4', 'speed': '<f4', 'accpos': '<f4', 'brake': '|u1', 'clutch': '|u1',
+        'ect': '<f4', 'iat': '<f4', 'gear': '<f4'}
 
-    def __init__(self, can_decoders, qtapplication):
-        self._last_unstable_gear_time = 0
+    # derived.Channel list evaluated live, the ones with log set are logged
+    # after the gear
+    derived_channels = derived.channels
+
+    # signals read by update_displays
+    keys_to_display = ['rpm', 'speed', 'accpos', 'brake', 'clutch', 'ect', 'iat']
 
-        self.can_data = {}
+    # delta to the reference lap at which a pace bar is full, in seconds
+    pace_scale = 2.0
 
-        for decoder in can_decoders:
-            for field in decoder.result._fields:
-                self.can_data[field] = 0 
+
+    def __init__(self, can_decoders, qtapplication):
+        # written by the CAN thread, read here through consistent snapshots
+        self.signal_store = signalstore.SignalStore(can_decoders)
+        self.can_data = self.signal_store.snapshot()
+
+        # recomputed only when one of their inputs changed
+        self.derived = derived.DerivedChannels(self.derived_channels)
+        derived_fields = [f for f in self.derived.sources if f in self.signal_store.slots]
+
+        # only the CAN IDs carrying these are read (and in lazy mode decoded)
+        self._display_groups = self.signal_store.groups_for(self.keys_to_display + derived_fields)
+        self._log_groups = self.signal_store.groups_for(self.keys_to_log + self.keys_to_display + derived_fields)
+
+        # evaluated on the CAN thread once per frame carrying a gear input,
+        # display and logger read the latest result. In lazy mode nothing is
+        # decoded on the CAN thread, poll_gear() evaluates the latest frames
+        # at display and log rate instead.
+        self.gear_detector = gear.GearDetector(self.ref_gear_ratios)
+        self._gear_inputs = dict.fromkeys(gear.inputs, 0)
+        self._gear_fields = {}
+        self._gear_decoders = {}
+        for d in self.signal_store.decoders:
+            fields = [f for f in gear.inputs if f in d.result._fields]
+            if fields:
+                self._gear_fields[d.result] = fields
+                self._gear_decoders[canfilter.frame_id(d)] = d
+        self._gear_ids = np.array(list(self._gear_decoders), dtype=np.uint32)
+        self._gear_groups = [self.signal_store.groups[i] for i in self._gear_decoders]
+        self._gear_seq = [0] * len(self.signal_store.ranges)
+        # set with the bulk backend, where get_can_batch feeds every gear
+        # frame of a batch and get_can_update only sees the last one per ID
+        self.gear_per_batch = False
+        # the gear IDs may arrive on different buses, i.e. receive threads
+        self._gear_lock = threading.Lock()
 
         self.app = qtapplication
         
@@ -64,118 +107,241 @@ class DisplayManager(DataLoggableABC):
         f.setStrikeOut(True)
         self.state_label_font_strikeout = f
 
+        # Qt is only called when a rendered value or style state changes
+        ui = self.app.ui
+        self.widget_updates = widgetbinding.UpdateCounter()
+        c = self.widget_updates
+        state_styles = {'down': (state_label_down_style, self.state_label_font_strikeout),
+            'up': (state_label_up_style, self.state_label_font)}
+
+        self.mph_text = widgetbinding.TextBinding(ui.mphLabel, c)
+        self.rpm_text = widgetbinding.TextBinding(ui.rpmLabel, c)
+        self.gear_text = widgetbinding.TextBinding(ui.gearLabel, c)
+        self.ect_text = widgetbinding.TextBinding(ui.ectLabel, c)
+        self.iat_text = widgetbinding.TextBinding(ui.iatLabel, c)
+        self.rpm_value = widgetbinding.CallBinding(ui.tachometer.setValue, c)
+        self.clutch_value = widgetbinding.PropertyBinding(ui.clutchProgressbar, "value", c)
+        self.brake_value = widgetbinding.PropertyBinding(ui.brakeProgressbar, "value", c)
+        self.gas_value = widgetbinding.PropertyBinding(ui.gasProgressbar, "value", c)
+        self.rpm_band = widgetbinding.CallBinding(ui.tachometer.setBand, c)
+        self.can_state_style = widgetbinding.StyleBinding(ui.canStateLabel, state_styles, c)
+        self.gps_state_style = widgetbinding.StyleBinding(ui.gpsStateLabel, state_styles, c)
+        self.live_timer_text = widgetbinding.TextBinding(ui.liveTimerLabel, c)
+        self.predicted_time_text = widgetbinding.TextBinding(ui.predictedTimeLabel, c)
+        self.best_time_text = widgetbinding.TextBinding(ui.bestTimeLabel, c)
+        self.timer_title = widgetbinding.CallBinding(ui.groupBox_6.setTitle, c)
+        self.negative_pace_value = widgetbinding.PropertyBinding(ui.negativePaceProgressbar, "value", c)
+        self.positive_pace_value = widgetbinding.PropertyBinding(ui.positivePaceProgressbar, "value", c)
+        self.show_widget_updates = False
+
+        # set to an instrumentation.Instrumentation to record latencies
+        self.instrumentation = None
+        self._group_keys = self.signal_store.keys
+        self._painted_seq = [0] * len(self._group_keys)
+
+        # GPS fixes and wheel speed, for positions at CAN timestamps
+        self.fusion = gpsfusion.GpsCanFusion()
+        self._speed_group = self.signal_store.field_groups['speed']
+        self._speed_index = self.signal_store.slots['speed'] - self.signal_store.ranges[self._speed_group][0]
+        self._speed_seq = 0
+
+        # set to a laptiming.LapTimer when track segments are given
+        self.lap_timer = None
+        self._lap_timer_t = 0.
+        # set to a lapdelta.DeltaCursor to drive the pace bars
+        self.lap_delta = None
+        self._delta_lap_start = None
+        self._delta_start_distance = 0.
+
 
-    
-    def filtered_gear(self):
-        # too slow, avoid division by zero
-        if self.can_data['speed'] < 1:
-            self._last_unstable_gear_time = time.time()
-            return 'n'
-
-        # detect stable gear ratio
-        stable_ratio = None
-        for i, r in enumerate(self.ref_gear_ratios):
-            if 0.90 < ((self.can_data['rpm'] / self.can_data['speed']) / r) < 1.10:
-                stable_ratio = i + 1
-                break
-        
-        # no stable ratio detected, or clutched
-        if not stable_ratio or self.can_data['clutch'] or self.can_data['gearneutral']: 
-            self._last_unstable_gear_time = time.time()
-            return 'n'
-
-        # stable ratio detected, and time passed since last unstable
-        elif time.time() - self._last_unstable_gear_time > 0.1:
-            return stable_ratio
-        
-        # stable ratio detected, but timeout has not passed
-        # don't update unstable time
-        else:
-            return 'n'
     
     def format_hex(self, h):
         s = h.hex()
         return s[0:8] + '\n' + s[8:]
         
-    def get_can_update(self, data, timestamp):
-        for k, v in data._asdict().items():
-            self.can_data[k] = v
+    def get_can_update(self, data, timestamp, bus=None):
+        g = self.signal_store.write(data, timestamp, bus)
         self.last_can_update = time.time()
+        if type(data) in self._gear_fields and not self.gear_per_batch:
+            self.update_gear(data, timestamp)
+        if self.instrumentation:
+            self.instrumentation.record('store', self._group_keys[g], timestamp)
+
+    def get_can_raw_update(self, canid, data, timestamp, bus=None):
+        # lazy decode mode: keep the latest payload, decode when read
+        g = self.signal_store.write_raw(canid, data, timestamp, bus)
+        self.last_can_update = time.time()
+        if self.instrumentation:
+            self.instrumentation.record('store', self._group_keys[g], timestamp)
+
+    def get_can_batch(self, frames, bus=None):
+        # bulk backend batch_posthook: every gear frame of the batch, in bus
+        # order, not just the last one per ID
+        for i in np.flatnonzero(np.isin(frames.id, self._gear_ids)).tolist():
+            decoder = self._gear_decoders[int(frames.id[i])]
+            self.update_gear(decoder.decode(frames.data[i, :frames.dlc[i]].tobytes()), float(frames.timestamp[i]))
+
+    def poll_gear(self):
+        # lazy mode: decode the gear IDs that got new payloads since the last
+        # call, oldest first; eagerly written groups are left to the CAN thread
+        store = self.signal_store
+        changed = []
+        for g in self._gear_groups:
+            if store.raw[g] is None:
+                continue
+            seq, timestamp, values = store.read_group(g)
+            if seq != self._gear_seq[g]:
+                self._gear_seq[g] = seq
+                changed.append((timestamp, g, values))
+        for timestamp, g, values in sorted(changed):
+            self.update_gear(store.decoders[g].result._make(values), timestamp)
+
+    def update_gear(self, data, timestamp):
+        with self._gear_lock:
+            inputs = self._gear_inputs
+            for f in self._gear_fields[type(data)]:
+                inputs[f] = getattr(data, f)
+            self.gear_detector.update(timestamp, inputs['rpm'], inputs['speed'], inputs['clutch'], inputs['gearneutral'])
 
     def update_displays(self):
+        if not self.instrumentation:
+            return self._update_displays()
+
+        started = self.instrumentation.display_started()
+        self._update_displays()
+        self.instrumentation.display_finished(started)
+
+        # age of each newly shown frame when its values reached the widgets
+        store = self.signal_store
+        for g in self._display_groups:
+            seq = store.seq[g]
+            if seq != self._painted_seq[g]:
+                self._painted_seq[g] = seq
+                self.instrumentation.record('paint', self._group_keys[g], store.timestamps[g])
+
+    def _update_displays(self):
+        self.can_data = self.signal_store.snapshot(self._display_groups)
+        self.poll_gear()
         rpm = self.can_data['rpm']
-        gear = self.filtered_gear()
+        gear = self.gear_detector.gear
+        values = self.update_derived()
 
-        self.app.ui.mphLabel.setText(f"{abs(self.can_data['speed'] * 0.621371):.0f}")
-        self.app.ui.rpmProgressbar.setProperty("value", f"{rpm:.0f}")
-        self.app.ui.rpmLabel.setText(f"{rpm:.0f}")
-        self.app.ui.gearLabel.setText(str(gear).upper())
-        self.app.ui.ectLabel.setText(f"{self.can_data['ect']:.0f}")
-        self.app.ui.iatLabel.setText(f"{self.can_data['iat']:.0f}")
+        self.mph_text.set(f"{values['mph']:.0f}")
+        self.rpm_value.set(round(rpm))
+        self.rpm_text.set(f"{rpm:.0f}")
+        self.gear_text.set(str(gear).upper())
+        self.ect_text.set(f"{self.can_data['ect']:.0f}")
+        self.iat_text.set(f"{self.can_data['iat']:.0f}")
 
-        self.app.ui.clutchProgressbar.setProperty("value", 100 if self.can_data['clutch'] else 0)
-        self.app.ui.brakeProgressbar.setProperty("value", 100 if self.can_data['brake'] else 0)
-        self.app.ui.gasProgressbar.setProperty("value", self.can_data['accpos'])
+        self.clutch_value.set(100 if self.can_data['clutch'] else 0)
+        self.brake_value.set(100 if self.can_data['brake'] else 0)
+        self.gas_value.set(self.can_data['accpos'])
 
         if time.time() - self.last_can_update > 1:
-            self.app.ui.canStateLabel.setStyleSheet('font: 18pt "Targa MS"; color: red;')
-            self.app.ui.canStateLabel.setFont(self.state_label_font_strikeout)
+            self.can_state_style.set('down')
             self.canbus_down = True
-        elif self.canbus_down:
-            self.app.ui.canStateLabel.setStyleSheet('font: 18pt "Targa MS"; color: rgb(246, 245, 244);')
-            self.app.ui.canStateLabel.setFont(self.state_label_font)
+        else:
+            self.can_state_style.set('up')
             self.canbus_down = False
         
 
         if self.gps_manager:
             self.gps_response = self.gps_manager.get_lat_long()
+        self.update_fusion()
+        if self.lap_timer:
+            self.update_lap_timer()
 
         # replace with gps down condition
         if not (self.gps_manager and self.gps_response):
-            self.app.ui.gpsStateLabel.setStyleSheet('font: 18pt "Targa MS"; color: red;')
-            self.app.ui.gpsStateLabel.setFont(self.state_label_font_strikeout)
+            self.gps_state_style.set('down')
             self.gps_down = True
-        elif self.gps_down:
-            self.app.ui.gpsStateLabel.setStyleSheet('font: 18pt "Targa MS"; color: rgb(246, 245, 244);')
-            self.app.ui.gpsStateLabel.setFont(self.state_label_font)
+        else:
+            self.gps_state_style.set('up')
             self.gps_down = False
         
 
 
-        if gear != 'n' and gear > 1:
-            revlimit1 = revlimit2 * self.ref_gear_ratios[gear - 1] / self.ref_gear_ratios[gear - 2]
-        else:
-            revlimit1 = 5000
-
-        
-        
-        if rpm > revlimit2 and ((time.time() * 5) % 1) < 0.5:
-            self.app.ui.rpmProgressbar.setStyleSheet('''
-            QProgressBar {
-                background-color: #555;
-            }
-            QProgressBar::chunk {background: rgb(255, 27, 36);}
-            ''')
-        elif rpm > revlimit1:
-            self.app.ui.rpmProgressbar.setStyleSheet('''
-            QProgressBar {
-                background-color: #555;
-            }
-            QProgressBar::chunk {background: rgb(246, 211, 45);}
-            ''')
-        else:
-            self.app.ui.rpmProgressbar.setStyleSheet('''
-            QProgressBar {
-                background-color: #555;
-            }
-            QProgressBar::chunk {background: rgb(53, 132, 228);}
-            ''')
+        # red flashes, showing yellow in between
+        band = values['shiftlight']
+        if band == 2 and ((time.time() * 5) % 1) >= 0.5:
+            band = 1
+        self.rpm_band.set(derived.shiftlight_bands[band])
+
+        if self.widget_updates.tick() and self.show_widget_updates:
+            logging.info(f"Widget updates: {self.widget_updates.rate:.0f}/s")
+
+    def update_derived(self):
+        # from the latest snapshot in can_data and the detected gear
+        sources = dict(self.can_data)
+        sources['gear'] = self.gear_detector.gear
+        return self.derived.update(sources)
+
+    def update_fusion(self):
+        seq, timestamp, values = self.signal_store.read_group(self._speed_group)
+        if seq != self._speed_seq:
+            self._speed_seq = seq
+            self.fusion.add_speed(timestamp, values[self._speed_index])
+
+        if self.gps_response and self.gps_response[0]:
+            fix = self.gps_manager.get_fix()
+            if fix:
+                self.fusion.add_fix(fix.get_time().timestamp(), *fix.position())
+
+    def update_lap_timer(self):
+        t = self.signal_store.timestamps[self._speed_group]
+        if t == self._lap_timer_t:
+            return
+        self._lap_timer_t = t
+        timer = self.lap_timer
+        position = self.position(t)
+        if position:
+            timer.update(t, *position)
+        if self.lap_delta:
+            self.update_lap_delta(t)
+
+        self.live_timer_text.set(laptiming.format_time(timer.elapsed(t)))
+        self.predicted_time_text.set(laptiming.format_time(timer.predicted()))
+        self.best_time_text.set(laptiming.format_time(timer.best_lap))
+        # current sector and the time of the one just completed
+        if timer.sector_times:
+            self.timer_title.set(f"S{timer.sector + 1}  {laptiming.format_time(timer.sector_times[-1])}")
+        elif timer.lap_start is not None:
+            self.timer_title.set(f"S{timer.sector + 1}")
+
+    def update_lap_delta(self, t):
+        timer = self.lap_timer
+        delta = None
+        if timer.lap_start is not None:
+            if timer.lap_start != self._delta_lap_start:
+                self._delta_lap_start = timer.lap_start
+                self._delta_start_distance = self.fusion.distance_at(timer.lap_start)
+                self.lap_delta.reset()
+            distance = self.fusion.distance_at(t) - self._delta_start_distance
+            delta = self.lap_delta.delta(distance, t - timer.lap_start)
+
+        bar = 0 if delta is None else min(round(abs(delta) / self.pace_scale * 100), 100)
+        self.negative_pace_value.set(bar if delta is not None and delta > 0 else 0)
+        self.positive_pace_value.set(bar if delta is not None and delta < 0 else 0)
+
+    def position(self, timestamp=None):
+        # fused (lat, lon) at a bus timestamp, default the latest speed frame
+        if timestamp is None:
+            timestamp = self.signal_store.timestamps[self._speed_group]
+        return self.fusion.position(timestamp)
 
     @classmethod
     def get_log_labels(cls):
-        return [k for k in cls.keys_to_log] + ['gear']
-    
+        return [k for k in cls.keys_to_log] + ['gear'] + derived.DerivedChannels(cls.derived_channels).logged
+
+    @classmethod
+    def get_log_types(cls):
+        types = dict(cls.log_types)
+        types.update((c.name, c.log_type) for c in cls.derived_channels if c.log)
+        return types
+
     def get_log_data(self):
+        self.can_data = self.signal_store.snapshot(self._log_groups)
+        self.poll_gear()
         log_line = []
         for k in self.keys_to_log:
             data = self.can_data[k]
@@ -184,7 +350,11 @@ class DisplayManager(DataLoggableABC):
             else:
                 log_line.append(str(data))
 
-        log_line.append(str(self.filtered_gear()))
+        log_line.append(str(self.gear_detector.gear))
+
+        values = self.update_derived()
+        for k in self.derived.logged:
+            log_line.append(str(values[k]))
 
         return log_line
 
@@ -193,19 +363,25 @@ class DisplayManager(DataLoggableABC):
 
 class GPSManager(DataLoggableABC):
 
-    def __init__(self):
-        gpsd2.connect()
+    def __init__(self, host=gpsreader.default_host, port=gpsreader.default_port):
+        # gpsd is read in a background thread, display and logger only look
+        # at the latest fix it published
+        self.reader = gpsreader.GPSReader(host, port)
+        self.reader.start()
 
         self.last_logged_time = 0
         self.last_reported_time = 0
 
+    def stop(self):
+        self.reader.stop()
+
+    def get_fix(self):
+        # latest 3D fix as a gpsreader.GpsFix, or None
+        return self._get_gps()
+
     def _get_gps(self):
-        try:
-            gps_data = gpsd2.get_current()
-        except UserWarning as w:
-            return None
-        
-        if gps_data.mode != 3:
+        gps_data = self.reader.latest()
+        if not gps_data or gps_data.mode != 3:
             return None
 
         return gps_data
@@ -229,6 +405,11 @@ class GPSManager(DataLoggableABC):
     @classmethod
     def get_log_labels(cls):
         return ['gps_updated', 'gpstime', 'lat', 'long']
+
+    @classmethod
+    def get_log_types(cls):
+        # gpstime, lat and long need float64
+        return {'gps_updated': '|u1'}
     
     def get_log_data(self):
         gps_data = self._get_gps()
@@ -251,39 +432,132 @@ class GPSManager(DataLoggableABC):
 
 
 class DataLogger():
+    # write_log only samples the loggables and enqueues the row; a writer
+    # thread formats and writes rows in batches and fsyncs at most every
+    # fsync_interval seconds or fsync_bytes bytes, whichever comes first
 
-    def __init__(self, log_filename: str, logableclasses: list[DataLoggableABC]=[]):
+    # log_format 'csv' writes text, 'binary' fixed width records readable
+    # with binlog.read_log. With segment_seconds, log_filename is a session
+    # directory (see segmentlog) getting a new file every segment_seconds.
+
+    def __init__(self, log_filename: str, logableclasses: list[DataLoggableABC]=[], queue_size=1000,
+            fsync_interval=0.5, fsync_bytes=64 * 1024, late_after=1.0, log_format='csv', segment_seconds=None):
         self.loggableclasses = logableclasses
         self.logging_status = False
 
-        if os.path.exists(log_filename):
+        if os.path.exists(log_filename) and not segment_seconds:
             raise Exception(f'Logfile already exists: {log_filename}')
 
-        self.logfile = open(log_filename, 'w')
-        
-        labels = itertools.chain.from_iterable([l.get_log_labels() for l in self.loggableclasses])
-        self.logfile.write('time,' + ','.join(labels) + '\n')
+        labels = list(itertools.chain.from_iterable([l.get_log_labels() for l in self.loggableclasses]))
+        if log_format == 'binary':
+            types = {}
+            for l in self.loggableclasses:
+                types.update(l.get_log_types())
+            self.dtype = binlog.make_dtype(labels, types)
+            header, ext = binlog.header(self.dtype), '.bin'
+        else:
+            self.dtype = None
+            header, ext = 'time,' + ','.join(labels) + '\n', '.csv'
+
+        if segment_seconds:
+            self.logfile = segmentlog.SegmentWriter(log_filename, header, ext, segment_seconds)
+        else:
+            self.logfile = open(log_filename, 'w' if self.dtype is None else 'wb')
+            self.logfile.write(header)
+
+        self.fsync_interval = fsync_interval
+        self.fsync_bytes = fsync_bytes
+        # rows that took longer than this from write_log to disk
+        self.late_after = late_after
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self.rows_late = 0
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, name='datalogger', daemon=True)
+        self._thread.start()
 
     def get_logging_status(self):
         return self.logging_status
     
     def write_log(self):
-        data =  itertools.chain.from_iterable([l.get_log_data() for l in self.loggableclasses])
-        t = time.time()
-
+        data = [l.get_log_data() for l in self.loggableclasses]
         try:
-            self.logfile.write(str(t) + ',' + ','.join(data) + '\n')
-            self.logfile.flush()
-            os.fsync(self.logfile)
-            self.logging_status = True
-
-        except Exception as e:
-            print(f'Exception occured during logging: {e}')
-            self.logging_status = False
+            self._queue.put_nowait((time.time(), data))
+        except queue.Full:
+            self.rows_dropped += 1
+
+    def _encode(self, rows):
+        if self.dtype is not None:
+            return binlog.encode_rows([(t, list(itertools.chain.from_iterable(data))) for t, data in rows], self.dtype)
+        return ''.join(str(t) + ',' + ','.join(itertools.chain.from_iterable(data)) + '\n' for t, data in rows)
+
+    def _write_rows(self, rows):
+        if isinstance(self.logfile, segmentlog.SegmentWriter):
+            return self.logfile.write_rows(rows, self._encode)
+        encoded = self._encode(rows)
+        self.logfile.write(encoded)
+        return len(encoded)
+
+    def _run(self):
+        pending = []
+        unsynced = 0
+        last_sync = time.monotonic()
+        running = True
+
+        while running:
+            # block until a row arrives, or until the pending rows are due
+            # for an fsync, then take everything that queued up meanwhile
+            rows = []
+            timeout = max(self.fsync_interval - (time.monotonic() - last_sync), 0) if pending else None
+            try:
+                rows.append(self._queue.get(timeout=timeout))
+                while True:
+                    rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            if None in rows:
+                rows = rows[:rows.index(None)]
+                running = False
+
+            written = False
+            try:
+                if rows:
+                    unsynced += self._write_rows(rows)
+                    pending.extend(t for t, _ in rows)
+                written = True
+
+                if pending and (not running or unsynced >= self.fsync_bytes
+                        or time.monotonic() - last_sync >= self.fsync_interval):
+                    self.logfile.flush()
+                    os.fsync(self.logfile)
+                    now = time.time()
+                    self.rows_written += len(pending)
+                    self.rows_late += sum(1 for t in pending if now - t > self.late_after)
+                    pending = []
+                    unsynced = 0
+                    last_sync = time.monotonic()
+                self.logging_status = True
+
+            except Exception:
+                logging.exception('Exception occured during logging')
+                if not written:
+                    # the batch never reached the file
+                    self.rows_dropped += len(rows)
+                self.logging_status = False
+
+    def close(self):
+        # flush everything queued so far to disk and stop the writer
+        if not self._thread.is_alive():
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self.logfile.close()
+        logging.info(f'Log rows written: {self.rows_written}, dropped: {self.rows_dropped}, late: {self.rows_late}')
         
 
 
-
     
 
 
@@ -294,6 +568,14 @@ class ApplicationWindow(QtWidgets.QMainWindow):
         self.ui = Ui_MainWindow()
         self.ui.setupUi(self)
 
+        # swap the stylesheet driven rpm bar from the designer file for the
+        # pixmap cached tachometer
+        bar = self.ui.rpmProgressbar
+        self.ui.tachometer = tachwidget.TachometerWidget(bar.parentWidget(), maximum=bar.maximum())
+        self.ui.tachometer.setSizePolicy(bar.sizePolicy())
+        self.ui.verticalLayout_2.replaceWidget(bar, self.ui.tachometer)
+        bar.hide()
+
     def keyPressEvent(self, keyEvent) -> None:
         logging.info(f"Key pressed: {keyEvent.text()}")
         if keyEvent.text() == 'q':
@@ -305,32 +587,99 @@ def main():
                     prog = 'Dashboard',
                     description = 'Dashboard')
 
-    parser.add_argument('-i', '--interface', type=str, default='vcan0', help='CAN interface to sniff')
+    parser.add_argument('-i', '--interface', type=str, action='append',
+        help='CAN interface to sniff, default vcan0. Repeat for more buses; CHANNEL=ID,ID,... decodes only '
+        'those IDs there (8 hex digits for extended IDs), the other IDs go to the first interface without a list')
     parser.add_argument('-l', '--log', type=str, help='Logging file')
+    parser.add_argument('--log-format', choices=['csv', 'binary'], default='csv', help='Logging file format')
+    parser.add_argument('-r', '--record', type=str, help='Record every received CAN frame to this file')
+    parser.add_argument('--segment-seconds', type=float,
+        help='Write the log and recording as session directories, starting a new segment every this many seconds')
     parser.add_argument('-s', '--segments', help='Track sector segments')
     parser.add_argument('-m', '--microsegments', help='Track microsegments')
+    parser.add_argument('--reference', help='Reference lap from lapdelta.py for the pace bars, needs --segments')
+    parser.add_argument('--gpsd', type=str, default=f'{gpsreader.default_host}:{gpsreader.default_port}',
+        help='gpsd address, host:port')
+    parser.add_argument('--lazy-decode', action='store_true', help='Decode CAN frames only when the display or logger reads them')
+    parser.add_argument('--bulk-rx', action='store_true', help='Receive socketcan frames in batches instead of through python-can')
+    parser.add_argument('--asyncio', action='store_true', help='Run acquisition, logging and display on one asyncio event loop, needs the optional qasync package')
+    parser.add_argument('--widget-stats', action='store_true', help='Log widget updates per second')
+    parser.add_argument('--bus-stats', action='store_true', help='Log received frames per second of every bus')
+    parser.add_argument('--latency', choices=['dump', 'overlay'],
+        help='Record CAN to display latencies, print them on exit or also show them on screen')
 
     args = parser.parse_args()
+    if args.reference and not args.segments:
+        parser.error('--reference needs --segments')
 
-    can_decoders = [candecoder.Can200Decoder, candecoder.Can201Decoder, candecoder.Can211Decoder, \
-        candecoder.Can212Decoder, candecoder.Can215Decoder, candecoder.Can231Decoder, \
-        candecoder.Can240Decoder, candecoder.Can420Decoder, candecoder.Can430Decoder]
+    can_decoders = signalspec.decoders
     
     app = QtWidgets.QApplication(sys.argv)
     application = ApplicationWindow()
 
 
-    interface = args.interface
+    bus_decoders = canmanager.assign_decoders(args.interface or ['vcan0'], can_decoders)
 
     dm = DisplayManager(can_decoders=can_decoders, qtapplication=application)
-
-    mgr = canmanager.CanBusManager(interface, decoders=can_decoders)
-
-    gpsmgr = GPSManager()
-
-    mgr.posthook = dm.get_can_update
+    if args.widget_stats:
+        logging.getLogger().setLevel(logging.INFO)
+        dm.show_widget_updates = True
+
+    loop = asyncmode.create_event_loop(app) if args.asyncio else None
+
+    mgr = canmanager.CanBusManager(list(bus_decoders), decoders=bus_decoders,
+        backend='bulk' if args.bulk_rx else 'notifier', loop=loop)
+    app.aboutToQuit.connect(mgr.stop)
+
+    if args.bus_stats:
+        logging.getLogger().setLevel(logging.INFO)
+        bus_stats_timer = QTimer(app)
+        bus_stats_timer.timeout.connect(lambda: logging.info('Bus frames/s: ' + ', '.join(
+            f'{channel} {rate:.0f}' for channel, rate in mgr.throughput().items())))
+        bus_stats_timer.start(1000)
+
+    if args.record:
+        if args.segment_seconds:
+            mgr.recorder = segmentlog.SegmentedFrameRecorder(args.record, args.segment_seconds)
+        else:
+            mgr.recorder = framelog.FrameRecorder(args.record)
+        app.aboutToQuit.connect(mgr.recorder.close)
+
+    if args.latency:
+        inst = instrumentation.Instrumentation(signals={key: d.result._fields[:-1]
+            for key, d in zip(dm.signal_store.keys, dm.signal_store.decoders)})
+        dm.instrumentation = inst
+        dm.signal_store.instrumentation = inst
+        mgr.instrumentation = inst
+        app.aboutToQuit.connect(lambda: print(inst.report()))
+        if args.latency == 'overlay':
+            application.latency_overlay = instrumentation.LatencyOverlay(application, inst)
+
+    gps_host, _, gps_port = args.gpsd.rpartition(':')
+    gpsmgr = GPSManager(gps_host, int(gps_port))
+    app.aboutToQuit.connect(gpsmgr.stop)
+
+    if args.lazy_decode:
+        mgr.raw_posthook = dm.get_can_raw_update
+    else:
+        mgr.posthook = dm.get_can_update
+        if args.bulk_rx:
+            mgr.batch_posthook = dm.get_can_batch
+            dm.gear_per_batch = True
     dm.gps_manager = gpsmgr
+    if args.segments:
+        dm.lap_timer = laptiming.LapTimer(laptiming.load_gates(args.segments),
+            laptiming.load_gates(args.microsegments) if args.microsegments else ())
+        if args.reference:
+            dm.lap_delta = lapdelta.DeltaCursor(lapdelta.ReferenceLap.load(args.reference))
 
+    if args.asyncio:
+        logger = DataLogger(args.log, [dm, gpsmgr], log_format=args.log_format,
+            segment_seconds=args.segment_seconds) if args.log else None
+        if logger:
+            app.aboutToQuit.connect(logger.close)
+        application.show()
+        sys.exit(asyncmode.run(loop, app, mgr, dm, logger))
 
 
     display_timer = QTimer(app)
@@ -339,8 +688,9 @@ def main():
     display_timer.timeout.connect(dm.update_displays)
 
     if args.log:
-        logger = DataLogger(args.log, [dm, gpsmgr])
-
+        logger = DataLogger(args.log, [dm, gpsmgr], log_format=args.log_format,
+            segment_seconds=args.segment_seconds)
+        app.aboutToQuit.connect(logger.close)
 
         log_timer = QTimer(app)
         log_timer.setInterval(10)
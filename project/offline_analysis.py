@@ -1,71 +1,108 @@
 import numpy as np
-import re, sys
+import os, argparse
 from candecoder import *
+import signalspec, tracestore, paralleldecode, pipeline, segmentlog, gear, derived, canfilter
 from collections import defaultdict
 import matplotlib.pyplot as plt
 
-def main():
-    filename = sys.argv[1]
-    pat = re.compile(r"\(([0-9\.]+)\) [\w]+ ([0-9]+)#([\w]+)") 
-
-    results = []
 
-    with open(filename) as file:
-        for l in file:
-            res = pat.match(l)
-            if res:
-                time, id, data = res.group(1, 2, 3)
-                time = float(time)
-                id = int(id, 16)
-                data = bytes.fromhex(data)
-                results.append((time, id, data))
+def complete_traces(traces, decoders):
+    # every field of every decoder, empty where its ID had no frames, as
+    # paralleldecode returns them
+    for d in decoders:
+        if any(f not in traces for f in d.result._fields):
+            batch = d.decode_batch(np.empty((0, 8), dtype=np.uint8), np.empty(0))
+            for f, values in batch.fields._asdict().items():
+                traces.setdefault(f, [batch.timestamp, values])
+    return traces
 
-    decoders = [Can201Decoder, Can231Decoder]
 
-    traces = {}
+def main():
+    parser = argparse.ArgumentParser(
+                    prog = 'offline_analysis',
+                    description = 'Offline CAN log analysis')
+
+    parser.add_argument('log', type=str, help='candump log file, frame recording or session directory')
+    parser.add_argument('--no-cache', action='store_true', help='Decode the whole log without the binary sidecar cache')
+    parser.add_argument('-j', '--jobs', type=int, help='Decode the whole log in parallel with this many processes')
+    parser.add_argument('--stream', type=float, metavar='BIN', help='Stream the log with bounded memory, plotting BIN second averages')
+    parser.add_argument('--window', type=float, nargs=2, metavar=('START', 'STOP'),
+        help='Session directories only: seconds from the session start to analyze')
+
+    args = parser.parse_args()
+
+    decoders = [signalspec.Can201Decoder, signalspec.Can231Decoder]
+    fields = ['accpos', 'can201unknown1', 'speed']
+
+    if os.path.isdir(args.log):
+        session = segmentlog.Session(args.log)
+        # the whole session unless a window is given; stop is exclusive
+        start = stop = None
+        if args.window:
+            time_range = session.time_range()
+            if time_range is None:
+                parser.error(f'No recorded segments in {args.log}')
+            start, stop = time_range[0] + args.window[0], time_range[0] + args.window[1]
+        frames = session.frames(start, stop, ids=[canfilter.frame_id(d) for d in decoders])
+        ids = np.unique(frames.id)
+        traces = {k: list(v) for k, v in next(pipeline.decode([frames], decoders), {}).items()}
+        complete_traces(traces, decoders)
+    elif args.stream:
+        chunks = pipeline.select(pipeline.read(args.log), [canfilter.frame_id(d) for d in decoders])
+        sinks = {k: [pipeline.TimeBinned(args.stream), pipeline.RunningStats()] for k in fields}
+        results = pipeline.run(pipeline.decode(chunks, decoders), sinks)
+
+        ids = [canfilter.frame_id(d) for d in decoders]
+        traces = {}
+        for k, (binned, stats) in results.items():
+            print(k, stats)
+            traces[k] = [binned[0], binned[1]]
+    elif args.jobs or args.no_cache:
+        ids, traces = paralleldecode.decode_parallel(args.log, decoders, processes=args.jobs or 1)
+    else:
+        store = tracestore.TraceStore(args.log, decoders)
+        ids = store.ids()
+        traces = {k: list(store.trace(k)) for d in decoders for k in d.result._fields}
+
+    print(sorted([hex(x) for x in ids]))
+    print(sorted(traces.keys()))
 
-    canID = set()
-    
-    for res in results:
-        canID.add(res[1])
-        decoder = find_decoder(res, decoders)
-        if not decoder:
-            continue # not implemented
-        
+    # the dashboard's gear detection, run over the whole trace
+    if all(k in traces for k in gear.inputs):
+        traces['gear'] = list(gear.GearDetector(gear.ref_gear_ratios).detect_traces(traces))
 
-        data = decoder.decode(res[2])
+    engine = derived.DerivedChannels()
+    if all(k in traces for k in engine.sources):
+        traces.update((k, list(v)) for k, v in engine.evaluate_traces(traces).items())
 
-        for field in data._fields:
-            if not field in traces:
-                traces[field] = ([], [])
-            traces[field][0].append(res[0])
-            traces[field][1].append(getattr(data, field))
-    
-    print(sorted([hex(x) for x in canID]))
-    print(sorted(traces.keys()))
+    # the stream branch only has the binned fields
+    if 'speed' in traces:
+        traces['speed'][1] = traces['speed'][1] * 0.621371
 
-    for k in traces:
-        traces[k] = np.array(traces[k])
+    if 'accpos' in traces and 'can201unknown1' in traces:
+        fig = plt.figure()
 
-    traces['speed'][1] = traces['speed'][1] * 0.621371
 
+        ax = fig.gca()
+        ax2 = ax.twinx()
 
-    fig = plt.figure()
+        ax.plot(traces['accpos'][0], traces['accpos'][1])
+        ax2.plot(traces['can201unknown1'][0], traces['can201unknown1'][1], 'r')
 
+        fig = plt.figure()
 
-    ax = fig.gca()
-    ax2 = ax.twinx()
-    
-    ax.plot(traces['accpos'][0], traces['accpos'][1])
-    ax2.plot(traces['can201unknown1'][0], traces['can201unknown1'][1], 'r')
 
-    fig = plt.figure()
+        ax = fig.gca()
+        ax2 = ax.twinx()
 
+        ax2.plot(traces['accpos'][1], traces['can201unknown1'][1], 'r.')
 
-    ax = fig.gca()
-    ax2 = ax.twinx()
-    
-    ax2.plot(traces['accpos'][1], traces['can201unknown1'][1], 'r.')
+    if 'gear' in traces:
+        fig = plt.figure()
+        ax = fig.gca()
+        ax2 = ax.twinx()
+        ax.plot(traces['rpm'][0], traces['rpm'][1])
+        ax2.step(traces['gear'][0], traces['gear'][1], 'g', where='post')
 
 
 #     fig = plt.figure()
@@ -0,0 +1,67 @@
+import multiprocessing, os
+import numpy as np
+
+import framelog, canfilter
+
+# Parallel parse and decode of candump logs and frame recordings. Each log
+# is cut into line (or chunk) aligned byte ranges, every range is parsed and
+# decoded in a worker process, and the per field arrays are merged back in
+# timestamp order.
+
+
+def decode_range(filename, start, stop, decoders):
+    frames = framelog.read_log(filename, start=start, stop=stop)
+
+    traces = {}
+    for decoder in decoders:
+        mask = frames.id == canfilter.frame_id(decoder)
+        batch = decoder.decode_batch(frames.data[mask], frames.timestamp[mask])
+
+        for field, values in batch.fields._asdict().items():
+            traces[field] = (batch.timestamp, values)
+
+    return np.unique(frames.id), traces
+
+
+def _decode_range(job):
+    return decode_range(*job)
+
+
+def merge_traces(results):
+    ids = np.unique(np.concatenate([r[0] for r in results])) if results else np.empty(0, dtype=np.uint32)
+
+    traces = {}
+    for field in {f for r in results for f in r[1]}:
+        parts = [r[1][field] for r in results if field in r[1]]
+        timestamp = np.concatenate([p[0] for p in parts])
+        values = np.concatenate([p[1] for p in parts])
+
+        # ranges are merged in file order, which is already time ordered for
+        # a single candump log; only sort when logs or ranges overlap
+        if np.any(np.diff(timestamp) < 0):
+            order = np.argsort(timestamp, kind='stable')
+            timestamp, values = timestamp[order], values[order]
+        traces[field] = [timestamp, values]
+
+    return ids, traces
+
+
+def decode_parallel(filenames, decoders, processes=None, ranges_per_process=4):
+    if isinstance(filenames, str):
+        filenames = [filenames]
+    processes = processes or os.cpu_count()
+
+    # split so every worker gets several ranges, balancing uneven files
+    total = sum(os.path.getsize(f) for f in filenames) or 1
+    jobs = []
+    for filename in filenames:
+        n = max(1, round(processes * ranges_per_process * os.path.getsize(filename) / total))
+        jobs += [(filename, start, stop, decoders) for start, stop in framelog.split_log(filename, n)]
+
+    if processes == 1:
+        results = [_decode_range(job) for job in jobs]
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.map(_decode_range, jobs, chunksize=1)
+
+    return merge_traces(results)
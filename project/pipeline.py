@@ -0,0 +1,134 @@
+import numpy as np
+
+import candump, framelog, canfilter
+
+# Generator based analysis pipeline with bounded memory:
+#
+#   read(log) -> select(ids) -> decode(decoders) -> run(sinks)
+#
+# Every stage works on one chunk of the log at a time and sinks aggregate
+# incrementally, so a multi GB log is summarized without holding it.
+
+
+def read(filename, chunk_size=candump.default_chunk_size):
+    yield from framelog.iter_log(filename, chunk_size)
+
+
+def select(chunks, ids):
+    ids = np.fromiter(ids, dtype=np.uint32)
+    for frames in chunks:
+        mask = np.isin(frames.id, ids)
+        if np.any(mask):
+            yield candump.Frames(*(col[mask] for col in frames))
+
+
+def decode(chunks, decoders):
+    # yields {field: (timestamp, values)} per chunk
+    for frames in chunks:
+        out = {}
+        for decoder in decoders:
+            mask = frames.id == canfilter.frame_id(decoder)
+            if not np.any(mask):
+                continue
+            batch = decoder.decode_batch(frames.data[mask], frames.timestamp[mask])
+            for field, values in batch.fields._asdict().items():
+                out[field] = (batch.timestamp, values)
+        if out:
+            yield out
+
+
+class RunningStats():
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.
+        self.min = np.inf
+        self.max = -np.inf
+
+    def update(self, timestamp, values):
+        if not len(values):
+            return
+        values = np.asarray(values, dtype=np.float64)
+        self.count += len(values)
+        self.total += values.sum()
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else np.nan
+
+    def result(self):
+        return {'count': self.count, 'min': self.min, 'max': self.max, 'mean': self.mean}
+
+
+class Histogram():
+
+    def __init__(self, bins):
+        self.edges = np.asarray(bins, dtype=np.float64)
+        self.counts = np.zeros(len(self.edges) - 1, dtype=np.int64)
+
+    def update(self, timestamp, values):
+        self.counts += np.histogram(np.asarray(values, dtype=np.float64), self.edges)[0]
+
+    def result(self):
+        return self.edges, self.counts
+
+
+class TimeBinned():
+    # per time bin count/min/max/mean, the downsampled output for plotting
+
+    def __init__(self, bin_width):
+        self.bin_width = bin_width
+        self.first = None
+        self.count = np.zeros(0, dtype=np.int64)
+        self.total = np.zeros(0)
+        self.min = np.zeros(0)
+        self.max = np.zeros(0)
+
+    def _grow(self, n):
+        extra = n - len(self.count)
+        if extra <= 0:
+            return
+        # grow geometrically so appending bins stays amortized O(1)
+        extra = max(extra, len(self.count))
+        self.count = np.concatenate([self.count, np.zeros(extra, dtype=np.int64)])
+        self.total = np.concatenate([self.total, np.zeros(extra)])
+        self.min = np.concatenate([self.min, np.full(extra, np.inf)])
+        self.max = np.concatenate([self.max, np.full(extra, -np.inf)])
+
+    def update(self, timestamp, values):
+        if not len(values):
+            return
+        values = np.asarray(values, dtype=np.float64)
+        bins = np.floor(np.asarray(timestamp) / self.bin_width).astype(np.int64)
+        if self.first is None:
+            self.first = bins[0]
+        # samples before the first bin (out of order logs) land in bin 0
+        bins = np.maximum(bins - self.first, 0)
+        self._grow(bins.max() + 1)
+
+        np.add.at(self.count, bins, 1)
+        np.add.at(self.total, bins, values)
+        np.minimum.at(self.min, bins, values)
+        np.maximum.at(self.max, bins, values)
+
+    def result(self):
+        # (bin centre time, mean, min, max) of the non empty bins
+        used = np.flatnonzero(self.count)
+        if self.first is None:
+            return tuple(np.zeros(0) for _ in range(4))
+        t = (used + self.first + 0.5) * self.bin_width
+        return t, self.total[used] / self.count[used], self.min[used], self.max[used]
+
+
+def run(decoded, sinks):
+    # sinks: {field: [sink, ...]}; returns {field: [result, ...]}
+    for chunk in decoded:
+        for field, field_sinks in sinks.items():
+            if field in chunk:
+                timestamp, values = chunk[field]
+                for sink in field_sinks:
+                    sink.update(timestamp, values)
+
+    return {field: [sink.result() for sink in field_sinks] for field, field_sinks in sinks.items()}
@@ -0,0 +1,298 @@
+import collections, json, os, threading
+import numpy as np
+
+import binlog, candump, framelog
+
+# Session directories: logs cut into time bounded segments with an index.
+#
+#   index.json           one entry per closed segment: file, kind, time
+#                        range, frame or row count, per ID frame counts
+#                        (frames) or sparse [time, byte offset] pairs
+#                        (csv rows)
+#   frames-00000.rec     framelog recordings
+#   rows-00000.csv|bin   DataLogger output, each with its own header
+#
+# Every segment is a complete file in its usual format. The index is
+# rewritten atomically whenever a segment is closed; segments that were
+# still open when the dashboard died are indexed on the fly by Session.
+#
+# Session returns the frames or rows of a time window by only opening the
+# segments overlapping it, then seeking inside them through the framelog
+# chunk index, a binary search over the binary log time column or the
+# sparse CSV offsets.
+
+index_version = 1
+
+# SessionIndex instances for the same directory may live in several writer
+# threads, e.g. the frame recorder and DataLogger sharing a session
+_index_lock = threading.Lock()
+
+
+class SessionIndex():
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def load(self):
+        try:
+            with open(self.path('index.json')) as file:
+                index = json.load(file)
+        except FileNotFoundError:
+            return {'version': index_version, 'segments': []}
+        if index.get('version') != index_version:
+            raise ValueError(f'Unsupported session index version {index.get("version")}')
+        return index
+
+    def add(self, entry):
+        with _index_lock:
+            index = self.load()
+            index['segments'].append(entry)
+            tmp = self.path('index.json.tmp')
+            with open(tmp, 'w') as file:
+                json.dump(index, file)
+            os.replace(tmp, self.path('index.json'))
+
+    def next_name(self, prefix, ext):
+        with _index_lock:
+            n = 0
+            while os.path.exists(self.path(f'{prefix}-{n:05d}{ext}')):
+                n += 1
+            name = f'{prefix}-{n:05d}{ext}'
+            # claim it before another writer does
+            open(self.path(name), 'xb').close()
+            return name
+
+
+def frames_entry(directory, name):
+    filename = os.path.join(directory, name)
+    chunks = framelog.read_index(filename)
+    ids = collections.Counter()
+    for frames in framelog.iter_chunks(filename):
+        ids.update(dict(zip(*(a.tolist() for a in np.unique(frames.id, return_counts=True)))))
+    return {'file': name, 'kind': 'frames', 't_first': min((c.t_first for c in chunks), default=None),
+        't_last': max((c.t_last for c in chunks), default=None), 'count': sum(c.count for c in chunks),
+        'ids': {f'{k:X}': v for k, v in sorted(ids.items())}}
+
+
+class SegmentedFrameRecorder(framelog.FrameRecorder):
+    # FrameRecorder starting a new recording every segment_seconds of bus time
+
+    def __init__(self, directory, segment_seconds=60., **kwargs):
+        self.session = SessionIndex(directory)
+        self.segment_seconds = segment_seconds
+        self._segment_end = None
+        self._ids = collections.Counter()
+        super(SegmentedFrameRecorder, self).__init__(None, **kwargs)
+
+    def _open(self, filename):
+        self.name = self.session.next_name('frames', '.rec')
+        self.file = open(self.session.path(self.name), 'wb')
+        self.file.write(framelog.magic)
+        self.index = []
+        self._segment_end = None
+        self._ids.clear()
+
+    def _finish(self):
+        super(SegmentedFrameRecorder, self)._finish()
+        if not self.index:
+            os.remove(self.session.path(self.name))
+            return
+        self.session.add({'file': self.name, 'kind': 'frames', 't_first': min(c.t_first for c in self.index),
+            't_last': max(c.t_last for c in self.index), 'count': sum(c.count for c in self.index),
+            'ids': {f'{k:X}': v for k, v in sorted(self._ids.items())}})
+
+    def _write_chunks(self, frames):
+        while len(frames.timestamp):
+            if self._segment_end is None:
+                self._segment_end = frames.timestamp[0] + self.segment_seconds
+            later = frames.timestamp >= self._segment_end
+            n = int(np.argmax(later)) if later.any() else len(later)
+            if n:
+                head = candump.Frames(*(col[:n] for col in frames))
+                super(SegmentedFrameRecorder, self)._write_chunks(head)
+                self._ids.update(dict(zip(*(a.tolist() for a in np.unique(head.id, return_counts=True)))))
+            if n == len(later):
+                return
+            self._finish()
+            self._open(None)
+            frames = candump.Frames(*(col[n:] for col in frames))
+
+
+class SegmentWriter():
+    # file like sink for DataLogger rows, starting a new segment file every
+    # segment_seconds. flush() and fileno() apply to the current segment,
+    # so os.fsync works on it.
+
+    def __init__(self, directory, header, ext, segment_seconds=60., offset_every=256):
+        self.session = SessionIndex(directory)
+        self.header = header.encode() if isinstance(header, str) else header
+        self.ext = ext
+        self.segment_seconds = segment_seconds
+        # csv segments get a [time, offset] pair every offset_every rows
+        self.offset_every = offset_every
+        self.file = None
+
+    def _open(self, t):
+        self.name = self.session.next_name('rows', self.ext)
+        self.file = open(self.session.path(self.name), 'wb')
+        self.file.write(self.header)
+        self.segment_end = t + self.segment_seconds
+        self.t_first = t
+        self.t_last = t
+        self.count = 0
+        self.offsets = []
+
+    def _finish(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        entry = {'file': self.name, 'kind': 'rows', 't_first': self.t_first, 't_last': self.t_last,
+            'count': self.count}
+        if self.ext == '.csv':
+            entry['offsets'] = self.offsets
+        self.session.add(entry)
+        self.file = None
+
+    def write_rows(self, rows, encode):
+        # rows of (time, data) in time order, encode turns rows into str or
+        # bytes; returns the bytes written
+        written = 0
+        i = 0
+        while i < len(rows):
+            t = rows[i][0]
+            if self.file is None:
+                self._open(t)
+            elif t >= self.segment_end:
+                self._finish()
+                self._open(t)
+
+            # up to the segment end, and in offset_every blocks within it
+            block = self.offset_every - self.count % self.offset_every
+            j = i
+            while j < len(rows) and j - i < block and rows[j][0] < self.segment_end:
+                j += 1
+            j = max(j, i + 1)
+
+            if self.count % self.offset_every == 0:
+                self.offsets.append([t, self.file.tell()])
+            encoded = encode(rows[i:j])
+            encoded = encoded.encode() if isinstance(encoded, str) else encoded
+            self.file.write(encoded)
+            written += len(encoded)
+            self.count += j - i
+            self.t_last = rows[j - 1][0]
+            i = j
+        return written
+
+    def flush(self):
+        if self.file:
+            self.file.flush()
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        if self.file:
+            self._finish()
+
+
+class Session():
+
+    def __init__(self, directory):
+        self.index = SessionIndex(directory)
+        self.segments = self.index.load()['segments']
+
+        # segments left open by a crash, or still being written
+        indexed = {s['file'] for s in self.segments}
+        for name in sorted(os.listdir(directory)):
+            if name in indexed or not name.startswith(('frames-', 'rows-')):
+                continue
+            entry = self._recover(name)
+            if entry and entry['count']:
+                self.segments.append(entry)
+
+    def _recover(self, name):
+        path = self.index.path(name)
+        if not os.path.getsize(path):
+            return None
+        if name.endswith('.rec'):
+            return frames_entry(self.index.directory, name)
+        if name.endswith('.bin'):
+            rows = binlog.read_log(path)
+            times = rows['time']
+            return {'file': name, 'kind': 'rows', 't_first': float(times[0]) if len(times) else None,
+                't_last': float(times[-1]) if len(times) else None, 'count': len(times)}
+        with open(path, 'rb') as file:
+            names = file.readline().decode().strip().split(',')
+            rows = binlog.parse_csv(file.read(), names)
+        return {'file': name, 'kind': 'rows', 't_first': float(rows['time'][0]) if len(rows) else None,
+            't_last': float(rows['time'][-1]) if len(rows) else None, 'count': len(rows),
+            'offsets': [[float(rows['time'][0]), len(','.join(names)) + 1]] if len(rows) else []}
+
+    def _overlapping(self, kind, t_start, t_stop):
+        for s in sorted((s for s in self.segments if s['kind'] == kind), key=lambda s: s['t_first']):
+            if t_start is not None and s['t_last'] < t_start:
+                continue
+            if t_stop is not None and s['t_first'] >= t_stop:
+                continue
+            yield s
+
+    def time_range(self):
+        # (first, last) timestamp of the session, None without any segments
+        if not self.segments:
+            return None
+        return (min(s['t_first'] for s in self.segments), max(s['t_last'] for s in self.segments))
+
+    def id_counts(self):
+        counts = collections.Counter()
+        for s in self.segments:
+            counts.update({int(k, 16): v for k, v in s.get('ids', {}).items()})
+        return dict(counts)
+
+    def frames(self, t_start=None, t_stop=None, ids=None):
+        # Frames with t_start <= timestamp < t_stop, optionally only these IDs
+        chunks = []
+        for s in self._overlapping('frames', t_start, t_stop):
+            if ids is not None and not any(f'{i:X}' in s['ids'] for i in ids):
+                continue
+            for frames in framelog.iter_chunks(self.index.path(s['file']), t_start=t_start, t_stop=t_stop):
+                if ids is not None:
+                    frames = candump.Frames(*(col[np.isin(frames.id, list(ids))] for col in frames))
+                chunks.append(frames)
+        return candump.concatenate_frames(chunks)
+
+    def rows(self, t_start=None, t_stop=None):
+        # DataLogger rows with t_start <= time < t_stop as a structured array
+        parts = []
+        for s in self._overlapping('rows', t_start, t_stop):
+            path = self.index.path(s['file'])
+            if s['file'].endswith('.bin'):
+                rows = binlog.read_log(path)
+                lo = 0 if t_start is None else np.searchsorted(rows['time'], t_start)
+                hi = len(rows) if t_stop is None else np.searchsorted(rows['time'], t_stop)
+                parts.append(np.array(rows[lo:hi]))
+                continue
+
+            offsets = s['offsets']
+            times = [o[0] for o in offsets]
+            first = 0 if t_start is None else max(np.searchsorted(times, t_start, side='right') - 1, 0)
+            last = len(offsets) if t_stop is None else np.searchsorted(times, t_stop, side='left')
+            with open(path, 'rb') as file:
+                names = file.readline().decode().strip().split(',')
+                file.seek(offsets[first][1])
+                data = file.read() if last >= len(offsets) else file.read(offsets[last][1] - offsets[first][1])
+            rows = binlog.parse_csv(data, names)
+            mask = np.ones(len(rows), dtype=bool)
+            if t_start is not None:
+                mask &= rows['time'] >= t_start
+            if t_stop is not None:
+                mask &= rows['time'] < t_stop
+            parts.append(rows[mask])
+
+        if not parts:
+            return np.empty(0, dtype=np.dtype([('time', '<f8')]))
+        return np.concatenate(parts)
@@ -0,0 +1,224 @@
+from collections import namedtuple
+import struct
+import numpy as np
+from candecoder import CanMessageDecoder, speed_correction
+
+# Minimal DBC-like signal description.
+#
+# Signals shorter than a byte are bit fields inside start_byte, start_bit
+# counting from the LSB. Signals of 8, 16, 24 or 32 bits are byte aligned
+# and span length/8 bytes from start_byte in the given byteorder.
+# byte_weight is the multiplier between successive bytes of a multi byte
+# signal; the 0x201 fields were reverse engineered with 255, not 256.
+# physical value = raw * scale + offset
+Signal = namedtuple('Signal',
+    ['name', 'start_byte', 'start_bit', 'length', 'byteorder', 'signed', 'scale', 'offset', 'unit', 'byte_weight'],
+    defaults=(0, 8, 'big', False, 1, 0, '', 256))
+
+_word_codes = {1: 'B', 2: 'H', 4: 'I'}
+
+
+def _check_signal(canid, sig):
+    if sig.length < 8:
+        if sig.start_bit + sig.length > 8:
+            raise ValueError(f'{canid:X}.{sig.name}: bit fields must not cross byte boundaries')
+    elif sig.length % 8 or sig.start_bit:
+        raise ValueError(f'{canid:X}.{sig.name}: multi byte signals must be byte aligned')
+    if sig.start_byte + max(sig.length // 8, 1) > 8:
+        raise ValueError(f'{canid:X}.{sig.name}: signal exceeds 8 byte payload')
+    if sig.byteorder not in ('big', 'little'):
+        raise ValueError(f'{canid:X}.{sig.name}: unknown byteorder {sig.byteorder}')
+
+
+def _signal_bytes(sig):
+    n = sig.length // 8
+    idx = list(range(sig.start_byte, sig.start_byte + n))
+    # most significant byte first
+    return idx if sig.byteorder == 'big' else idx[::-1]
+
+
+def _apply_scale(expr, sig):
+    if sig.scale != 1:
+        expr = f'{expr} * {sig.scale!r}'
+    if sig.offset < 0:
+        expr = f'{expr} - {-sig.offset!r}'
+    elif sig.offset:
+        expr = f'{expr} + {sig.offset!r}'
+    return expr
+
+
+def _build_unpacker(signals):
+    # pick one struct code per needed byte range: whole words where a signal
+    # maps straight onto a native integer, single bytes everywhere else
+    order = '>'
+    for sig in signals:
+        if sig.length > 8:
+            order = '>' if sig.byteorder == 'big' else '<'
+            break
+
+    words = {}
+    byte_users = {}
+    for sig in signals:
+        n = sig.length // 8
+        if n > 1 and n in _word_codes and sig.byte_weight == 256 \
+                and (order == '>') == (sig.byteorder == 'big'):
+            words[sig.name] = (sig.start_byte, n)
+        else:
+            for b in _signal_bytes(sig) if n else [sig.start_byte]:
+                byte_users.setdefault(b, []).append(sig.name)
+
+    # words overlapping anything else fall back to single bytes
+    for name, (start, n) in list(words.items()):
+        span = set(range(start, start + n))
+        others = [s for other, (s2, n2) in words.items() if other != name for s in range(s2, s2 + n2)]
+        if span & (set(byte_users) | set(others)):
+            del words[name]
+            for b in span:
+                byte_users.setdefault(b, []).append(name)
+
+    word_at = {start: (name, n) for name, (start, n) in words.items()}
+    fmt = order
+    names = []
+    pos = 0
+    end = max([s + n for s, n in words.values()] + [b + 1 for b in byte_users], default=0)
+    while pos < end:
+        if pos in word_at:
+            name, n = word_at[pos]
+            sig = next(s for s in signals if s.name == name)
+            code = _word_codes[n]
+            fmt += code.lower() if sig.signed else code
+            names.append(f'w_{name}')
+            pos += n
+        elif pos in byte_users:
+            fmt += 'B'
+            names.append(f'b{pos}')
+            pos += 1
+        else:
+            fmt += 'x'
+            pos += 1
+
+    return struct.Struct(fmt), names, set(words)
+
+
+def _signal_expr(sig, words):
+    if sig.length < 8:
+        b = f'b{sig.start_byte}'
+        if sig.length == 1:
+            return f'bool({b} & {1 << sig.start_bit:#x})'
+        raw = f'({b} >> {sig.start_bit}) & {(1 << sig.length) - 1:#x}'
+        if sig.scale != 1 or sig.offset:
+            raw = f'({raw})'
+        return _apply_scale(raw, sig)
+
+    if sig.name in words:
+        raw = f'w_{sig.name}'
+    else:
+        idx = _signal_bytes(sig)
+        raw = f'b{idx[-1]}'
+        weight = 1
+        for b in reversed(idx[:-1]):
+            weight *= sig.byte_weight
+            raw = f'b{b} * {weight} + {raw}'
+        if sig.signed:
+            half = weight * sig.byte_weight // 2
+            raw = f'(({raw}) ^ {half:#x}) - {half:#x}'
+        if len(idx) > 1 and (sig.scale != 1 or sig.offset):
+            raw = f'({raw})'
+    return _apply_scale(raw, sig)
+
+
+def _signal_column(sig, data):
+    if sig.length < 8:
+        raw = (data[:, sig.start_byte] >> sig.start_bit) & ((1 << sig.length) - 1)
+        if sig.length == 1:
+            return raw != 0
+    else:
+        raw = np.zeros(len(data), dtype=np.int64)
+        weight = 1
+        idx = _signal_bytes(sig)
+        for b in reversed(idx):
+            raw += data[:, b].astype(np.int64) * weight
+            weight *= sig.byte_weight
+        if sig.signed:
+            half = weight // 2
+            raw = (raw ^ half) - half
+    if sig.scale != 1:
+        raw = raw * sig.scale
+    if sig.offset:
+        raw = raw + sig.offset
+    return raw
+
+
+def compile_decoder(canid, signals, name=None, extended=False) -> CanMessageDecoder:
+    # extended IDs are written with 8 digits as in candump logs, so their
+    # names and raw payload field differ from a standard ID of the same value
+    label = f'{canid:08X}' if extended else f'{canid:X}'
+    name = name or f'Can{label}Decoder'
+    for sig in signals:
+        _check_signal(canid, sig)
+
+    result = namedtuple(f'Can{label}Result', [s.name for s in signals] + [f'can{label}total'])
+    unpacker, names, words = _build_unpacker(signals)
+
+    lines = ['def decode(data):']
+    if names:
+        lines.append(f'    {", ".join(names)}, = _unpack_from(data)')
+    values = [_signal_expr(s, words) for s in signals] + ['data']
+    # tuple.__new__ skips the keyword handling of the namedtuple constructor
+    lines.append(f'    return _new(_result, ({", ".join(values)},))')
+    source = '\n'.join(lines)
+
+    namespace = {'_unpack_from': unpacker.unpack_from, '_result': result, '_new': tuple.__new__}
+    exec(source, namespace)
+
+    def decode_columns(cls, data):
+        return tuple(_signal_column(s, data) for s in cls.signals) + (data,)
+
+    decoder = type(name, (CanMessageDecoder,), {
+        'id': canid,
+        'extended': extended,
+        'result': result,
+        'signals': tuple(signals),
+        'units': {s.name: s.unit for s in signals},
+        'source': source,
+        'decode': staticmethod(namespace['decode']),
+        'decode_columns': classmethod(decode_columns),
+        '__module__': __name__,
+    })
+    return decoder
+
+
+Can200Decoder = compile_decoder(0x200, [
+    Signal('brake', 6, 0, 1),
+])
+
+Can201Decoder = compile_decoder(0x201, [
+    Signal('rpm', 0, length=16, scale=0.25, unit='rpm', byte_weight=255),
+    Signal('speed', 4, length=16, scale=0.01 * speed_correction, offset=-100. * speed_correction,
+        unit='km/h', byte_weight=255),
+    Signal('accpos', 6, scale=0.5, unit='%'),
+    Signal('can201unknown1', 2, length=16, offset=-0x7fff, byte_weight=255),
+])
+
+Can211Decoder = compile_decoder(0x211, [])
+Can212Decoder = compile_decoder(0x212, [])
+Can215Decoder = compile_decoder(0x215, [])
+
+Can231Decoder = compile_decoder(0x231, [
+    Signal('clutch', 1, 1, 1),
+    Signal('gearneutral', 1, 2, 1),
+])
+
+Can240Decoder = compile_decoder(0x240, [
+    Signal('calcload', 0, scale=100/255., unit='%'),
+    Signal('ect', 1, offset=-40, unit='degC'),
+    Signal('can240unknown1', 2),
+    Signal('throttlevalve', 3, scale=100/255., unit='%'),
+    Signal('iat', 4, offset=-40, unit='degC'),
+])
+
+Can420Decoder = compile_decoder(0x420, [])
+Can430Decoder = compile_decoder(0x430, [])
+
+decoders = [Can200Decoder, Can201Decoder, Can211Decoder, Can212Decoder, Can215Decoder,
+    Can231Decoder, Can240Decoder, Can420Decoder, Can430Decoder]
@@ -0,0 +1,151 @@
+import time
+
+import canfilter
+
+# Latest value store shared between the CAN receive thread (single writer)
+# and the Qt thread (readers).
+#
+# Every decoder result field has a fixed slot in one flat list and the fields
+# of one CAN ID occupy a contiguous range. Each ID has a sequence number used
+# as a seqlock: the writer makes it odd before touching the slots and even
+# again afterwards, readers retry if it was odd or changed while copying.
+# Readers therefore always see all fields of an ID from the same frame
+# without the writer ever taking a lock.
+#
+# In lazy mode the writer only swaps in the latest raw (timestamp, payload)
+# of an ID and readers decode it when they ask for it, so frames that are
+# overwritten before anybody looks are never decoded.
+#
+# With several buses each ID still has a single writer, the receive thread of
+# its bus; the bus of the latest frame of every ID is kept in buses.
+#
+# IDs are frame IDs as in Frames.id (canfilter.frame_id), extended IDs carry
+# CAN_EFF_FLAG and never collide with a standard ID of the same value.
+
+
+class SignalStore():
+
+    def __init__(self, decoders):
+        self.fields = []
+        self.slots = {}
+        self.ranges = []
+        self.groups = {}
+        self.decoders = list(decoders)
+        self._result_groups = {}
+
+        for g, decoder in enumerate(self.decoders):
+            start = len(self.fields)
+            self.fields.extend(decoder.result._fields)
+            self.ranges.append((start, len(self.fields)))
+            self.groups[canfilter.frame_id(decoder)] = g
+            self._result_groups[decoder.result] = g
+
+        self.field_groups = {}
+        for g, (start, stop) in enumerate(self.ranges):
+            for i in range(start, stop):
+                self.slots[self.fields[i]] = i
+                self.field_groups[self.fields[i]] = g
+
+        self.values = [0] * len(self.fields)
+        self.seq = [0] * len(self.ranges)
+        self.timestamps = [0.] * len(self.ranges)
+        self.buses = [None] * len(self.ranges)
+
+        self.raw = [None] * len(self.ranges)
+        self._decoded_raw = [None] * len(self.ranges)
+
+        self.retries = 0
+        self.decoded = 0
+        # set to an instrumentation.Instrumentation to record lazy decodes,
+        # under keys like the CAN listener's
+        self.instrumentation = None
+        self.keys = [f'{canfilter.frame_id(d):03X}' for d in self.decoders]
+
+    def write(self, data, timestamp, bus=None):
+        # called from the CAN thread with a decoder result namedtuple,
+        # returns the group written
+        g = self._result_groups[type(data)]
+        start, stop = self.ranges[g]
+        seq = self.seq
+
+        seq[g] += 1
+        self.values[start:stop] = data
+        self.timestamps[g] = timestamp
+        self.buses[g] = bus
+        seq[g] += 1
+        return g
+
+    def write_raw(self, canid, data, timestamp, bus=None):
+        # lazy mode, called from the CAN thread with the undecoded payload;
+        # replacing the tuple is atomic, so no seqlock is needed. The tuple
+        # carries its own sequence number, readers never pair a newer
+        # sequence with an older payload.
+        g = self.groups[canid]
+        seq = self.seq[g] + 2
+        self.raw[g] = (seq, timestamp, data)
+        self.buses[g] = bus
+        self.seq[g] = seq
+        return g
+
+    def _read_raw(self, g, raw):
+        start, stop = self.ranges[g]
+        seq, timestamp, data = raw
+        if raw is not self._decoded_raw[g]:
+            self.values[start:stop] = self.decoders[g].decode(data)
+            self.timestamps[g] = timestamp
+            self._decoded_raw[g] = raw
+            self.decoded += 1
+            if self.instrumentation:
+                self.instrumentation.record('decode', self.keys[g], timestamp)
+        return seq, self.timestamps[g], self.values[start:stop]
+
+    def read_group(self, g):
+        # (sequence, timestamp, values) of one CAN ID, all from the same frame
+        raw = self.raw[g]
+        if raw is not None:
+            return self._read_raw(g, raw)
+
+        start, stop = self.ranges[g]
+        seq = self.seq
+        while True:
+            before = seq[g]
+            if not before & 1:
+                values = self.values[start:stop]
+                timestamp = self.timestamps[g]
+                if seq[g] == before:
+                    return before, timestamp, values
+            self.retries += 1
+            # let the writer finish
+            time.sleep(0)
+
+    def read(self, canid):
+        return self.read_group(self.groups[canid])
+
+    def sequence(self, canid):
+        # cheap change detection: even values increase by 2 per frame
+        return self.seq[self.groups[canid]]
+
+    def received(self):
+        # frames written since startup
+        return sum(self.seq) // 2
+
+    def get(self, field):
+        g = self.field_groups[field]
+        if self.raw[g] is not None:
+            self._read_raw(g, self.raw[g])
+        return self.values[self.slots[field]]
+
+    def groups_for(self, fields):
+        # the CAN IDs needed to read these fields, for snapshot()
+        return sorted({self.field_groups[f] for f in fields})
+
+    def snapshot(self, groups=None):
+        # dict of every field of the given groups (default all), consistent
+        # per CAN ID
+        snapshot = {}
+        fields = self.fields
+        for g in range(len(self.ranges)) if groups is None else groups:
+            start, stop = self.ranges[g]
+            _, _, values = self.read_group(g)
+            snapshot.update(zip(fields[start:stop], values))
+        return snapshot
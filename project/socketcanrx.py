@@ -0,0 +1,205 @@
+import ctypes, ctypes.util, errno, logging, os, select, socket, struct, threading, time
+import numpy as np
+
+from candump import Frames
+
+# High throughput socketcan receive path.
+#
+# Frames are read from a raw CAN socket in batches with recvmmsg(2) into
+# preallocated buffers, one syscall for up to batch_size frames, and handed
+# on as columnar Frames instead of one can.Message per frame. Bus timestamps
+# come from SO_TIMESTAMPNS control messages. Where recvmmsg is unavailable
+# the socket is drained with non-blocking recv_into calls instead.
+
+CAN_EFF_FLAG = 0x80000000
+CAN_RTR_FLAG = 0x40000000
+CAN_ERR_FLAG = 0x20000000
+CAN_SFF_MASK = 0x000007ff
+CAN_EFF_MASK = 0x1fffffff
+
+MSG_DONTWAIT = 0x40
+SO_TIMESTAMPNS = getattr(socket, 'SO_TIMESTAMPNS', 35)
+
+can_frame_size = 16
+# CMSG_SPACE(sizeof(struct timespec)) on 64 bit Linux
+control_size = 32
+
+
+class iovec(ctypes.Structure):
+    _fields_ = [('iov_base', ctypes.c_void_p), ('iov_len', ctypes.c_size_t)]
+
+
+class msghdr(ctypes.Structure):
+    _fields_ = [('msg_name', ctypes.c_void_p), ('msg_namelen', ctypes.c_uint32),
+        ('msg_iov', ctypes.POINTER(iovec)), ('msg_iovlen', ctypes.c_size_t),
+        ('msg_control', ctypes.c_void_p), ('msg_controllen', ctypes.c_size_t),
+        ('msg_flags', ctypes.c_int)]
+
+
+class mmsghdr(ctypes.Structure):
+    _fields_ = [('msg_hdr', msghdr), ('msg_len', ctypes.c_uint)]
+
+
+def _load_recvmmsg():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        recvmmsg = libc.recvmmsg
+    except (OSError, AttributeError):
+        return None
+    recvmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(mmsghdr), ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+    recvmmsg.restype = ctypes.c_int
+    return recvmmsg
+
+
+_recvmmsg = _load_recvmmsg()
+
+
+def pack_filters(filters):
+    # same layout and extended flag handling as python-can's socketcan backend
+    data = []
+    for f in filters:
+        can_id, can_mask = f['can_id'], f['can_mask']
+        if 'extended' in f:
+            can_mask |= CAN_EFF_FLAG
+            if f['extended']:
+                can_id |= CAN_EFF_FLAG
+        data += [can_id, can_mask]
+    return struct.pack(f'={len(data)}I', *data)
+
+
+def open_can_socket(channel, filters=None):
+    sock = socket.socket(socket.AF_CAN, socket.SOCK_RAW, socket.CAN_RAW)
+    if filters is not None:
+        sock.setsockopt(socket.SOL_CAN_RAW, socket.CAN_RAW_FILTER, pack_filters(filters))
+    sock.bind((channel,))
+    return sock
+
+
+class BulkSocketcanReceiver():
+
+    def __init__(self, channel=None, filters=None, batch_size=256, on_batch=None, sock=None):
+        self.sock = sock or open_can_socket(channel, filters)
+        self.sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+        # bigger kernel queue to ride out scheduling hiccups at full bus load
+        try:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        except OSError:
+            pass
+        self.fd = self.sock.fileno()
+
+        self.batch_size = batch_size
+        self.on_batch = on_batch
+        self.frames_received = 0
+        self.batches_received = 0
+        self.batch_errors = 0
+
+        self._frames = np.zeros((batch_size, can_frame_size), dtype=np.uint8)
+        self._control = np.zeros((batch_size, control_size), dtype=np.uint8)
+        self._poll = select.poll()
+        self._poll.register(self.fd, select.POLLIN)
+        self._thread = None
+        self._running = False
+
+        self._use_recvmmsg = _recvmmsg is not None
+        if self._use_recvmmsg:
+            self._setup_headers()
+
+    def _setup_headers(self):
+        n = self.batch_size
+        self._iov = (iovec * n)()
+        self._msgs = (mmsghdr * n)()
+        frames_base = self._frames.ctypes.data
+        control_base = self._control.ctypes.data
+        for i in range(n):
+            self._iov[i].iov_base = frames_base + i * can_frame_size
+            self._iov[i].iov_len = can_frame_size
+            hdr = self._msgs[i].msg_hdr
+            hdr.msg_iov = ctypes.pointer(self._iov[i])
+            hdr.msg_iovlen = 1
+            hdr.msg_control = control_base + i * control_size
+
+        # the kernel shrinks msg_controllen to what it wrote, so it is reset
+        # before every call through this strided view
+        offset = mmsghdr.msg_hdr.offset + msghdr.msg_controllen.offset
+        self._controllen = np.ndarray((n,), dtype=np.uintp, buffer=self._msgs,
+            offset=offset, strides=(ctypes.sizeof(mmsghdr),))
+
+    def _receive_mmsg(self):
+        self._controllen[:] = control_size
+        self._control[:, :8] = 0
+        n = _recvmmsg(self.fd, self._msgs, self.batch_size, MSG_DONTWAIT, None)
+        if n < 0:
+            err = ctypes.get_errno()
+            if err in (errno.EAGAIN, errno.EINTR):
+                return 0
+            raise OSError(err, os.strerror(err))
+        return n
+
+    def _receive_loop(self):
+        n = 0
+        while n < self.batch_size:
+            try:
+                self.sock.recv_into(memoryview(self._frames[n]), can_frame_size, MSG_DONTWAIT)
+            except BlockingIOError:
+                break
+            n += 1
+        self._control[:n, :8] = 0
+        return n
+
+    def _decode(self, n):
+        raw = self._frames[:n]
+        can_id = raw[:, :4].copy().view('<u4')[:, 0]
+        keep = (can_id & (CAN_RTR_FLAG | CAN_ERR_FLAG)) == 0
+        extended = (can_id & CAN_EFF_FLAG) != 0
+        # extended IDs keep CAN_EFF_FLAG, so they stay apart from standard ones
+        canid = np.where(extended, can_id & (CAN_EFF_MASK | CAN_EFF_FLAG), can_id & CAN_SFF_MASK).astype(np.uint32)
+        dlc = np.minimum(raw[:, 4], 8)
+        data = raw[:, 8:16].copy()
+
+        # struct cmsghdr is followed by the struct timespec
+        control = self._control[:n]
+        cmsg_len = control[:, :8].copy().view('<u8')[:, 0]
+        ts = control[:, 16:32].copy().view('<i8')
+        timestamp = np.where(cmsg_len > 0, ts[:, 0] + ts[:, 1] * 1e-9, time.time())
+
+        return Frames(timestamp[keep], canid[keep], dlc[keep], data[keep])
+
+    def recv_batch(self, timeout=0.1):
+        # Frames of up to batch_size frames, None if nothing arrived in time
+        if not self._poll.poll(timeout * 1000):
+            return None
+        n = self._receive_mmsg() if self._use_recvmmsg else self._receive_loop()
+        if not n:
+            return None
+        self.frames_received += n
+        self.batches_received += 1
+        return self._decode(n)
+
+    def _run(self):
+        while self._running:
+            try:
+                frames = self.recv_batch()
+            except OSError as e:
+                logging.warning(f'CAN receive failed: {e}')
+                time.sleep(0.1)
+                continue
+            if frames is None or not self.on_batch:
+                continue
+            # like python-can's Notifier.on_error: a failing batch is logged
+            # and dropped, the receive thread keeps going
+            try:
+                self.on_batch(frames)
+            except Exception as e:
+                self.batch_errors += 1
+                logging.exception(f'CAN batch handler failed: {e}')
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='socketcanrx', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread:
+            self._thread.join()
+        self.sock.close()
@@ -0,0 +1,95 @@
+from PyQt5 import QtCore, QtGui, QtWidgets
+
+# Bar tachometer painted from cached pixmaps.
+#
+# The background and one fully filled bar per shift-light band are rendered
+# once per widget size. A paint only blits the part of the bar between the
+# previous and the new fill position out of those pixmaps, so a rev sweep
+# never re-parses stylesheets or repaints the whole widget.
+
+
+class TachometerWidget(QtWidgets.QWidget):
+
+    band_colors = {
+        'blue': QtGui.QColor(53, 132, 228),
+        'yellow': QtGui.QColor(246, 211, 45),
+        'red': QtGui.QColor(255, 27, 36),
+    }
+    background_color = QtGui.QColor(0x55, 0x55, 0x55)
+
+    def __init__(self, parent=None, maximum=7500):
+        super(TachometerWidget, self).__init__(parent)
+        self._maximum = maximum
+        self._value = 0
+        self._band = 'blue'
+        self._fill = 0
+        self._pixmaps = None
+
+        # every pixel is painted from the pixmaps, skip Qt's background erase
+        self.setAttribute(QtCore.Qt.WA_OpaquePaintEvent)
+
+    def maximum(self):
+        return self._maximum
+
+    def setMaximum(self, maximum):
+        self._maximum = maximum
+        self._set_fill(self._fill_for(self._value))
+
+    def value(self):
+        return self._value
+
+    def band(self):
+        return self._band
+
+    def _fill_for(self, value):
+        value = min(max(value, 0), self._maximum)
+        return int(self.width() * value / self._maximum) if self._maximum else 0
+
+    def _set_fill(self, fill):
+        if fill == self._fill:
+            return
+        left, right = sorted((fill, self._fill))
+        self._fill = fill
+        self.update(QtCore.QRect(left, 0, right - left, self.height()))
+
+    def setValue(self, value):
+        self._value = value
+        self._set_fill(self._fill_for(value))
+
+    def setBand(self, band):
+        if band == self._band:
+            return
+        self._band = band
+        self.update(QtCore.QRect(0, 0, self._fill, self.height()))
+
+    def _build_pixmaps(self):
+        pixmaps = {}
+        for name, color in [('background', self.background_color)] + list(self.band_colors.items()):
+            pixmap = QtGui.QPixmap(self.size())
+            pixmap.fill(color)
+            pixmaps[name] = pixmap
+        self._pixmaps = pixmaps
+
+    def resizeEvent(self, event):
+        self._pixmaps = None
+        self._fill = self._fill_for(self._value)
+        super(TachometerWidget, self).resizeEvent(event)
+
+    def paintEvent(self, event):
+        if self._pixmaps is None:
+            self._build_pixmaps()
+
+        painter = QtGui.QPainter(self)
+        rect = event.rect()
+        h = self.height()
+
+        filled = rect.intersected(QtCore.QRect(0, 0, self._fill, h))
+        if not filled.isEmpty():
+            painter.drawPixmap(filled, self._pixmaps[self._band], filled)
+
+        empty = rect.intersected(QtCore.QRect(self._fill, 0, self.width() - self._fill, h))
+        if not empty.isEmpty():
+            painter.drawPixmap(empty, self._pixmaps['background'], empty)
+
+    def sizeHint(self):
+        return QtCore.QSize(400, 60)
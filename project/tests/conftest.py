@@ -0,0 +1,4 @@
+import os, sys
+
+# the modules live flat in project/, as mainqt imports them
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
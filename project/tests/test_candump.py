@@ -0,0 +1,77 @@
+import os, re
+import numpy as np
+import pytest
+
+import candump
+
+fixture = os.path.join(os.path.dirname(__file__), 'data', 'candump.log')
+
+# the per line regex offline_analysis used before candump.py
+old_pattern = re.compile(r"\(([0-9\.]+)\) [\w]+ ([0-9]+)#([\w]+)")
+
+
+def assert_frames_equal(a, b):
+    assert len(a.timestamp) == len(b.timestamp)
+    np.testing.assert_array_equal(a.timestamp, b.timestamp)
+    np.testing.assert_array_equal(a.id, b.id)
+    np.testing.assert_array_equal(a.dlc, b.dlc)
+    np.testing.assert_array_equal(a.data, b.data)
+
+
+def test_fixture():
+    frames = candump.read_candump(fixture)
+    # comment, remote, CAN FD and truncated lines are skipped
+    assert frames.id.tolist() == [0x201, 0x231, 0x200, 0x420, 0x201 | candump.CAN_EFF_FLAG,
+        0x18FF0001 | candump.CAN_EFF_FLAG, 0x240, 0x201, 0x211, 0x430, 0x7FF, 0x201, 0x201]
+    assert frames.dlc.tolist() == [8, 8, 1, 0, 8, 4, 8, 8, 3, 2, 8, 2, 2]
+    assert frames.id.dtype == np.uint32 and frames.data.shape == (13, 8)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 40, 45, 64, 100, 333, 1 << 20])
+def test_chunked_matches_whole_file(chunk_size):
+    with open(fixture, 'rb') as file:
+        whole = candump.parse_buffer(np.frombuffer(file.read(), dtype=np.uint8))
+    assert_frames_equal(candump.read_candump(fixture, chunk_size=chunk_size), whole)
+    # every chunk ends at a line boundary, no frame is split or repeated
+    assert sum(len(f.timestamp) for f in candump.iter_chunks(fixture, chunk_size)) == len(whole.timestamp)
+
+
+@pytest.mark.parametrize('n', [1, 2, 3, 5, 16])
+def test_split_ranges_matches_whole_file(n):
+    ranges = candump.split_ranges(fixture, n)
+    assert ranges[0][0] == 0 and ranges[-1][1] == os.path.getsize(fixture)
+    parts = [candump.read_candump(fixture, start=start, stop=stop) for start, stop in ranges]
+    assert_frames_equal(candump.concatenate_frames(parts), candump.read_candump(fixture))
+
+
+def test_matches_old_regex():
+    with open(fixture, 'rb') as file:
+        lines = file.read().split(b'\n')
+    compared = 0
+    for line in lines:
+        frames = candump.parse_buffer(np.frombuffer(line, dtype=np.uint8))
+        m = old_pattern.match(line.decode())
+        if not m:
+            continue
+        t, canid, data = m.group(1, 2, 3)
+        try:
+            payload = bytes.fromhex(data)
+        except ValueError:
+            # remote frames and the like, which the old loop choked on
+            assert not len(frames.timestamp)
+            continue
+        assert len(frames.timestamp) == 1
+        assert frames.timestamp[0] == pytest.approx(float(t), abs=1e-6)
+        # candump writes extended IDs with 8 digits
+        assert frames.id[0] == int(canid, 16) | (candump.CAN_EFF_FLAG if len(canid) == 8 else 0)
+        assert frames.dlc[0] == len(payload)
+        assert bytes(frames.data[0, :frames.dlc[0]]) == payload
+        compared += 1
+    assert compared >= 10
+
+
+def test_extended_ids():
+    frames = candump.parse_buffer(np.frombuffer(
+        b'(1.000000) can0 18FF0001#01\n(1.000001) can0 201#02\n(1.000002) can0 00000201#03\n', dtype=np.uint8))
+    assert frames.id.tolist() == [0x18FF0001 | candump.CAN_EFF_FLAG, 0x201, 0x201 | candump.CAN_EFF_FLAG]
+    assert frames.data[:, 0].tolist() == [1, 2, 3]
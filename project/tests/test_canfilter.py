@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+import canfilter, signalspec
+
+
+def passes(filters, canid, extended):
+    # the kernel's CAN_RAW filter decision
+    return any((canid ^ f['can_id']) & f['can_mask'] == 0 and f['extended'] == extended for f in filters)
+
+
+@pytest.mark.parametrize('seed', range(200))
+def test_standard_filters_pass_exactly_the_ids(seed):
+    rng = np.random.default_rng(seed)
+    # clustered IDs merge into blocks, scattered ones do not
+    base = int(rng.integers(0, 0x700))
+    ids = set(rng.integers(base, base + 64, int(rng.integers(1, 40))).tolist())
+    ids |= set(rng.integers(0, 0x800, int(rng.integers(0, 10))).tolist())
+
+    filters = canfilter.minimal_filters(ids)
+    assert len(filters) <= len(ids)
+    assert {i for i in range(0x800) if passes(filters, i, False)} == ids
+    assert not any(passes(filters, i, True) for i in ids)
+
+
+@pytest.mark.parametrize('seed', range(50))
+def test_extended_filters_pass_exactly_the_ids(seed):
+    rng = np.random.default_rng(seed)
+    base = int(rng.integers(0, canfilter.extended_mask - 256))
+    ids = set(rng.integers(base, base + 256, int(rng.integers(1, 40))).tolist())
+
+    filters = canfilter.minimal_filters(ids, extended=True)
+    assert all(passes(filters, i, True) for i in ids)
+    # every ID one bit away from a registered one, and the whole range
+    # around them, is only passed when registered
+    near = {i ^ (1 << b) for i in ids for b in range(29)} | set(range(base - 256, base + 512))
+    for i in near - ids:
+        assert not passes(filters, i & canfilter.extended_mask, True)
+
+
+def test_out_of_range_ids():
+    with pytest.raises(ValueError):
+        canfilter.minimal_filters([0x800])
+    canfilter.minimal_filters([0x800], extended=True)
+
+
+def test_filters_for_keeps_standard_and_extended_apart():
+    extended = signalspec.compile_decoder(0x201, [], extended=True)
+    decoders = signalspec.decoders + [extended]
+    filters = canfilter.filters_for(decoders)
+    for d in signalspec.decoders:
+        assert passes(filters, d.id, False)
+    assert passes(filters, 0x201, True)
+    assert not passes(filters, 0x200, True)
+    assert canfilter.frame_id(extended) == 0x201 | 0x80000000
+    assert canfilter.frame_id(signalspec.Can201Decoder) == 0x201
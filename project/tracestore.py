@@ -0,0 +1,137 @@
+import hashlib, json, os, shutil
+import numpy as np
+
+import framelog, canfilter
+
+# Binary sidecar cache for a candump log or frame recording, written next to it as <log>.cache/
+#
+#   meta.json         source size/mtime, frame counts per ID, decoded fields
+#   <ID>.time         float64 bus timestamps of every frame with that ID
+#   <ID>.data         (N, 8) uint8 payloads
+#   <field>.npy       decoded values, sharing the timestamps of their ID
+#
+# Everything is opened memory mapped, so a warm cache opens in milliseconds
+# and only the pages of the IDs and fields actually used are read.
+
+
+def decoder_key(decoder):
+    # changes whenever the decoder definition changes, invalidating its traces
+    desc = f'{decoder.__module__}.{decoder.__qualname__}:{canfilter.frame_id(decoder)}:{getattr(decoder, "signals", "")}'
+    return hashlib.sha1(desc.encode()).hexdigest()
+
+
+class TraceStore():
+
+    version = 1
+
+    def __init__(self, log_filename, decoders=[], cache_dir=None):
+        self.log_filename = log_filename
+        self.cache_dir = cache_dir or log_filename + '.cache'
+        self.decoders = {canfilter.frame_id(d): d for d in decoders}
+        self.field_decoders = {f: d for d in decoders for f in d.result._fields}
+
+        self.meta = self._load_meta()
+        if self.meta is None:
+            self._build()
+
+    def _source_stat(self):
+        st = os.stat(self.log_filename)
+        return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+    def _path(self, name):
+        return os.path.join(self.cache_dir, name)
+
+    def _load_meta(self):
+        try:
+            with open(self._path('meta.json')) as file:
+                meta = json.load(file)
+        except (OSError, ValueError):
+            return None
+
+        if meta.get('version') != self.version or meta.get('source') != self._source_stat():
+            return None
+        return meta
+
+    def _write_meta(self):
+        tmp = self._path('meta.json.tmp')
+        with open(tmp, 'w') as file:
+            json.dump(self.meta, file)
+        os.replace(tmp, self._path('meta.json'))
+
+    def _build(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        os.makedirs(self.cache_dir)
+
+        source = self._source_stat()
+        counts = {}
+        files = {}
+        try:
+            # stream the log once, appending every chunk to per ID files
+            for frames in framelog.iter_log(self.log_filename):
+                order = np.argsort(frames.id, kind='stable')
+                ids = frames.id[order]
+                split = np.flatnonzero(np.diff(ids)) + 1
+                for group in np.split(order, split):
+                    if not len(group):
+                        continue
+                    canid = int(frames.id[group[0]])
+                    if canid not in files:
+                        files[canid] = (open(self._path(f'{canid:X}.time'), 'wb'),
+                            open(self._path(f'{canid:X}.data'), 'wb'))
+                    time_file, data_file = files[canid]
+                    time_file.write(frames.timestamp[group].tobytes())
+                    data_file.write(frames.data[group].tobytes())
+                    counts[canid] = counts.get(canid, 0) + len(group)
+        finally:
+            for f in files.values():
+                for file in f:
+                    file.close()
+
+        self.meta = {'version': self.version, 'source': source,
+            'counts': {f'{k:X}': v for k, v in sorted(counts.items())}, 'traces': {}}
+        self._write_meta()
+
+    def ids(self):
+        return [int(k, 16) for k in self.meta['counts']]
+
+    def count(self, canid):
+        return self.meta['counts'].get(f'{canid:X}', 0)
+
+    def frames(self, canid):
+        # (timestamp, data) for one ID, memory mapped
+        n = self.count(canid)
+        if not n:
+            return np.empty(0, dtype=np.float64), np.empty((0, 8), dtype=np.uint8)
+        timestamp = np.memmap(self._path(f'{canid:X}.time'), dtype=np.float64, mode='r', shape=(n,))
+        data = np.memmap(self._path(f'{canid:X}.data'), dtype=np.uint8, mode='r', shape=(n, 8))
+        return timestamp, data
+
+    def trace(self, field):
+        # (timestamp, values) for one decoded field, decoding and persisting
+        # the fields of its decoder on first use
+        decoder = self.field_decoders.get(field)
+        if decoder is None:
+            raise KeyError(f'No decoder provides field {field}')
+
+        timestamp, data = self.frames(canfilter.frame_id(decoder))
+        if field == decoder.result._fields[-1]:
+            # raw payload field, already stored
+            return timestamp, data
+
+        key = decoder_key(decoder)
+        if self.meta['traces'].get(field) != key:
+            batch = decoder.decode_batch(data, timestamp)
+            # skip the raw payload field, it is the frames themselves
+            for f in decoder.result._fields[:-1]:
+                # replace rather than overwrite, older traces may still be mapped
+                tmp = self._path(f'{f}.npy.tmp')
+                with open(tmp, 'wb') as file:
+                    np.save(file, np.asarray(getattr(batch.fields, f)))
+                os.replace(tmp, self._path(f'{f}.npy'))
+                self.meta['traces'][f] = key
+            self._write_meta()
+
+        return timestamp, np.load(self._path(f'{field}.npy'), mmap_mode='r')
+
+    def traces(self, fields):
+        return {f: self.trace(f) for f in fields}
@@ -0,0 +1,94 @@
+import time
+
+# Widget bindings that remember what was last rendered and only call into Qt
+# when the formatted value or style state actually changes. Every call that
+# reaches Qt is counted, so the widget update rate can be checked against
+# the CPU budget.
+
+
+class UpdateCounter():
+
+    def __init__(self, window=1.0):
+        self.window = window
+        self.count = 0
+        self.total = 0
+        self.rate = 0.
+        self._window_start = time.monotonic()
+
+    def tick(self):
+        # call once per refresh; updates rate every window seconds and
+        # returns True when it did
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed < self.window:
+            return False
+        self.rate = self.count / elapsed
+        self.total += self.count
+        self.count = 0
+        self._window_start = now
+        return True
+
+
+class TextBinding():
+
+    def __init__(self, widget, counter):
+        self.widget = widget
+        self.counter = counter
+        self.last = None
+
+    def set(self, text):
+        if text != self.last:
+            self.widget.setText(text)
+            self.last = text
+            self.counter.count += 1
+
+
+class PropertyBinding():
+
+    def __init__(self, widget, name, counter):
+        self.widget = widget
+        self.name = name
+        self.counter = counter
+        self.last = None
+
+    def set(self, value):
+        if value != self.last:
+            self.widget.setProperty(self.name, value)
+            self.last = value
+            self.counter.count += 1
+
+
+class CallBinding():
+    # for custom widgets driven through a setter, e.g. TachometerWidget
+
+    def __init__(self, setter, counter):
+        self.setter = setter
+        self.counter = counter
+        self.last = None
+
+    def set(self, value):
+        if value != self.last:
+            self.setter(value)
+            self.last = value
+            self.counter.count += 1
+
+
+class StyleBinding():
+    # states maps a state name to a stylesheet, or to (stylesheet, font);
+    # built once so switching state never formats stylesheets
+
+    def __init__(self, widget, states, counter):
+        self.widget = widget
+        self.states = {k: v if isinstance(v, tuple) else (v, None) for k, v in states.items()}
+        self.counter = counter
+        self.state = None
+
+    def set(self, state):
+        if state == self.state:
+            return
+        stylesheet, font = self.states[state]
+        self.widget.setStyleSheet(stylesheet)
+        if font is not None:
+            self.widget.setFont(font)
+        self.state = state
+        self.counter.count += 1